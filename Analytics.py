@@ -0,0 +1,182 @@
+import sqlite3
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+
+# Trading-day windows of the moving averages kept in analytics_daily
+MOVING_AVERAGES = (20, 50, 200)
+
+# Derived tables; stock_data stays the source of truth and every row here can be recomputed from it
+ANALYTICS_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS analytics_daily (
+        issuer_code TEXT,
+        "Date" DATE,
+        close REAL,
+        daily_return REAL,
+        ma20 REAL,
+        ma50 REAL,
+        ma200 REAL,
+        PRIMARY KEY (issuer_code, "Date")
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS analytics_weekly (
+        issuer_code TEXT,
+        period_start DATE,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume REAL,
+        turnover REAL,
+        trading_days INTEGER,
+        PRIMARY KEY (issuer_code, period_start)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS analytics_monthly (
+        issuer_code TEXT,
+        period_start DATE,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume REAL,
+        turnover REAL,
+        trading_days INTEGER,
+        PRIMARY KEY (issuer_code, period_start)
+    ) WITHOUT ROWID;
+    -- Issuers whose derived rows are stale from from_date on; written in the same transaction as the rows
+    CREATE TABLE IF NOT EXISTS analytics_pending (
+        issuer_code TEXT PRIMARY KEY,
+        from_date DATE
+    );
+'''
+
+PENDING_UPSERT_SQL = '''
+    INSERT INTO analytics_pending (issuer_code, from_date) VALUES (?, ?)
+    ON CONFLICT (issuer_code) DO UPDATE SET from_date = MIN(analytics_pending.from_date, excluded.from_date)
+'''
+
+# Resampled tables and the pandas period that groups their rows (weeks run Monday to Sunday)
+RESAMPLES = {
+    'weekly': ('analytics_weekly', 'W-SUN'),
+    'monthly': ('analytics_monthly', 'M')
+}
+
+
+def period_start(day: date, period: str) -> date:
+    return pd.Period(day, freq=period).start_time.date()
+
+
+def _records(frame: pd.DataFrame) -> List[tuple]:
+    values = frame.to_numpy(dtype=object)
+    values[frame.isna().to_numpy()] = None  # SQLite expects None rather than NaN for missing values
+    return list(map(tuple, values.tolist()))
+
+
+class AnalyticsStore:
+    """Daily returns, moving averages and weekly/monthly OHLC tables, maintained incrementally.
+
+    A write only marks the issuer's tail from the earliest written date as pending; apply_pending
+    recomputes each pending tail once, reading just enough earlier rows for the longest moving average.
+    Many writes to the same issuer (e.g. the windows of a backfill) therefore cost one recomputation.
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def setup(self, conn: sqlite3.Connection) -> bool:
+        """Create the tables; returns True when they did not exist yet."""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_daily'").fetchone()
+        conn.executescript(ANALYTICS_SCHEMA_SQL)
+        return not exists
+
+    def mark_pending(self, conn: sqlite3.Connection, earliest: Dict[str, date]):
+        """Record the earliest written date per issuer; cheap enough for every write transaction."""
+        conn.executemany(PENDING_UPSERT_SQL, [(code, day.isoformat()) for code, day in earliest.items()])
+
+    def apply_pending(self, conn: sqlite3.Connection) -> int:
+        """Recompute every pending tail and clear the marks; returns the number of issuers updated."""
+        pending = conn.execute("SELECT issuer_code, from_date FROM analytics_pending").fetchall()
+        for issuer_code, from_date in pending:
+            self.update(conn, issuer_code, date.fromisoformat(from_date))
+        conn.execute("DELETE FROM analytics_pending")
+        return len(pending)
+
+    def update(self, conn: sqlite3.Connection, issuer_code: str, from_date: Optional[date] = None):
+        """Recompute an issuer's derived rows from from_date on (everything when it is None)."""
+        load_from = None
+        if from_date is not None:
+            # Enough earlier rows for the longest average and the first return, and the start of the first period
+            lookback = self.db_manager.date_rows_before(conn, issuer_code, from_date, max(MOVING_AVERAGES) - 1)
+            if lookback is not None:
+                load_from = min([lookback] + [period_start(from_date, freq) for _, freq in RESAMPLES.values()])
+        frame = self.db_manager.load_issuer_frame(issuer_code, load_from, conn=conn)
+        if frame.empty:
+            return
+
+        self.write_daily(conn, issuer_code, frame, from_date)
+        for table, freq in RESAMPLES.values():
+            start = None if from_date is None else pd.Timestamp(period_start(from_date, freq))
+            self.write_resample(conn, issuer_code, frame if start is None else frame[frame['Date'] >= start],
+                                table, freq)
+
+    def write_daily(self, conn: sqlite3.Connection, issuer_code: str, frame: pd.DataFrame,
+                    from_date: Optional[date]):
+        close = frame['Last Trade Price']
+        daily = pd.DataFrame({
+            'issuer_code': issuer_code,
+            'Date': frame['Date'].dt.strftime("%Y-%m-%d"),
+            'close': close,
+            'daily_return': close.pct_change(fill_method=None).replace([np.inf, -np.inf], np.nan)
+        })
+        for window in MOVING_AVERAGES:
+            daily[f"ma{window}"] = close.rolling(window, min_periods=window).mean()
+        if from_date is not None:
+            # Earlier rows were only read as history for the averages
+            daily = daily[frame['Date'] >= pd.Timestamp(from_date)]
+        conn.executemany(
+            'INSERT OR REPLACE INTO analytics_daily (issuer_code, "Date", close, daily_return, ma20, ma50, ma200) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)', _records(daily))
+
+    def write_resample(self, conn: sqlite3.Connection, issuer_code: str, frame: pd.DataFrame, table: str, freq: str):
+        if frame.empty:
+            return
+        grouped = frame.groupby(frame['Date'].dt.to_period(freq))
+        resampled = pd.DataFrame({
+            'open': grouped['Last Trade Price'].first(),
+            'high': grouped['Max'].max(),
+            'low': grouped['Min'].min(),
+            'close': grouped['Last Trade Price'].last(),
+            'volume': grouped['Volume'].sum(),
+            'turnover': grouped['Turnover in BEST (denars)'].sum(),
+            'trading_days': grouped['Date'].count()
+        })
+        resampled.insert(0, 'period_start', resampled.index.start_time.strftime("%Y-%m-%d"))
+        resampled.insert(0, 'issuer_code', issuer_code)
+        conn.executemany(
+            f'INSERT OR REPLACE INTO {table} (issuer_code, period_start, open, high, low, close, volume, turnover, '
+            f'trading_days) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', _records(resampled))
+
+    def rebuild(self, conn: sqlite3.Connection, issuer_codes: Iterable[str]):
+        """Recompute the derived tables of the given issuers from scratch."""
+        for issuer_code in issuer_codes:
+            self.update(conn, issuer_code)
+
+    def read(self, conn: sqlite3.Connection, issuer_code: str, kind: str = 'daily',
+             start_date: Optional[date] = None, end_date: Optional[date] = None) -> pd.DataFrame:
+        """Rows of one derived table ('daily', 'weekly' or 'monthly') for an issuer, in date order."""
+        if kind == 'daily':
+            table, key = 'analytics_daily', '"Date"'
+        elif kind in RESAMPLES:
+            table, key = RESAMPLES[kind][0], 'period_start'
+        else:
+            raise ValueError(f"Unknown analytics table: {kind}")
+        query = f"SELECT * FROM {table} WHERE issuer_code = ?"
+        params = [issuer_code]
+        if start_date is not None:
+            query += f" AND {key} >= ?"
+            params.append(pd.Timestamp(start_date).strftime("%Y-%m-%d"))
+        if end_date is not None:
+            query += f" AND {key} <= ?"
+            params.append(pd.Timestamp(end_date).strftime("%Y-%m-%d"))
+        return pd.read_sql_query(query + f" ORDER BY {key}", conn, params=params)
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from typing import Dict
+
+
+class ConcurrencyController:
+    """AIMD limiter for in-flight requests.
+
+    The limit grows by about one request per round of successful, fast responses and is cut
+    multiplicatively when requests fail or get slower than the latency target. It can be used
+    anywhere an asyncio.Semaphore was used (``async with controller:``).
+    """
+
+    def __init__(self, initial_limit: int = 20, min_limit: int = 1, max_limit: int = 200,
+                 target_latency: float = 2.0, decrease_factor: float = 0.5, cooldown: float = 1.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.target_latency = target_latency  # Responses slower than this count as congestion
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown  # Minimum seconds between two decreases, so one burst of errors cuts once
+        self.in_flight = 0
+        self.paused_until = 0.0  # Set from Retry-After: nobody starts a request before this time
+        self.last_decrease = 0.0
+        self.condition = None  # Created lazily inside the running event loop
+        # Statistics
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.decreases = 0
+        self.lowest_limit = self.limit
+        self.highest_limit = self.limit
+        self.in_flight_area = 0.0  # Integral of in_flight over time, for the average concurrency
+        self.last_change = self.started_at
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        return self.condition
+
+    def _track_in_flight(self, delta: int):
+        now = time.monotonic()
+        self.in_flight_area += self.in_flight * (now - self.last_change)
+        self.last_change = now
+        self.in_flight += delta
+
+    async def acquire(self):
+        condition = self._get_condition()
+        async with condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    # Sleep outside the lock so other tasks can release meanwhile
+                    condition.release()
+                    try:
+                        await asyncio.sleep(wait)
+                    finally:
+                        await condition.acquire()
+                    continue
+                if self.in_flight < int(self.limit):
+                    break
+                await condition.wait()
+            self._track_in_flight(1)
+
+    async def release(self):
+        condition = self._get_condition()
+        async with condition:
+            self._track_in_flight(-1)
+            condition.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    def record(self, latency: float, ok: bool):
+        """Feed back the outcome of one request."""
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+
+        if ok and latency <= self.target_latency:
+            # Additive increase: about +1 once every request of the current window succeeded
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        else:
+            now = time.monotonic()
+            if now - self.last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self.last_decrease = now
+                self.decreases += 1
+
+        self.lowest_limit = min(self.lowest_limit, self.limit)
+        self.highest_limit = max(self.highest_limit, self.limit)
+
+    def pause(self, seconds: float):
+        """Hold back every new request for the given time, e.g. when the server sent Retry-After."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, float]:
+        now = time.monotonic()
+        elapsed = now - self.started_at
+        area = self.in_flight_area + self.in_flight * (now - self.last_change)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'elapsed': elapsed,
+            'requests_per_sec': self.requests / elapsed if elapsed else 0.0,
+            'average_concurrency': area / elapsed if elapsed else 0.0,
+            'limit': self.limit,
+            'lowest_limit': self.lowest_limit,
+            'highest_limit': self.highest_limit,
+            'decreases': self.decreases
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"Requests: {stats['requests']} ({stats['errors']} failed) at {stats['requests_per_sec']:.1f} req/s, "
+                f"average concurrency {stats['average_concurrency']:.1f}, "
+                f"limit {stats['lowest_limit']:.0f}-{stats['highest_limit']:.0f} "
+                f"(final {stats['limit']:.0f}, {stats['decreases']} backoffs)")
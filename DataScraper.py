@@ -1,78 +1,421 @@
 import asyncio
-from datetime import datetime, date
-from typing import Optional, Dict
-from queue import Queue, Empty
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta
+from typing import Optional, Dict, List, Tuple, AsyncIterator, Awaitable, Callable
+import ConcurrencyController
 import DatabaseManager
+import DatabaseWriter
+import MarketDayScraper
+import Metrics
 import MSEStockScraper
-import pandas as pd
+import StockRows
+import WindowCache
 
 
 class DataScraper:
     """Third pipe: Scrape and store missing data."""
 
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: DatabaseManager, connection_limit: int = 100, limit_per_host: int = 30,
+                 dns_cache_ttl: int = 300, keepalive_timeout: float = 30.0, use_window_cache: bool = True,
+                 cache_dir: str = 'window_cache', cache_max_bytes: int = 512 * 1024 * 1024,
+                 initial_concurrency: int = 20, target_latency: float = 2.0,
+                 base_url: str = MSEStockScraper.BASE_URL, verbose: bool = True,
+                 metrics_dir: Optional[str] = None, parse_workers: int = 2,
+                 stage_queue_size: int = 32, parse_processes: int = 0, market_day_url: Optional[str] = None):
         self.db_manager = db_manager
-        self.queue = Queue()
+        # Address of the market-wide daily results page ({date} and optionally {base_url} placeholders).
+        # When set, issuers that are only a few days behind are caught up from one page per trading day
+        self.market_day_url = market_day_url
+        # Streaming stages (fetch -> parse -> write) connected by bounded queues, so a slow
+        # database writer holds back the fetchers instead of letting pages pile up in memory.
+        # Parsing yields typed rows that the writer stores as they are, so there is no cleaning stage
+        self.parse_workers = parse_workers
+        self.stage_queue_size = stage_queue_size
+        # With parse_processes > 0 pages are parsed and converted in a process pool of that size,
+        # so a full backfill uses more than one core; 0 parses in threads of this process
+        self.parse_processes = parse_processes
+        self.parse_executor = None
         self.error_lock = asyncio.Lock()  # Use asyncio Lock for async context
         self.errors = []
+        # Connection pool settings for the session shared by every scraper in a run
+        self.connection_limit = connection_limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.session = None
+        self.base_url = base_url  # Site to scrape; pointed at a local stand-in by the benchmarks
+        # Global budget of in-flight requests, created per run and adapted to the site's latency and errors
+        self.limiter = None
+        self.initial_concurrency = initial_concurrency
+        self.target_latency = target_latency
+        # Per-issuer progress (scraper, rows so far, windows still running)
+        self.pending = {}
+        # Background writer that owns all database writes during a run
+        self.writer = None
+        # Pages of closed windows are read from disk instead of being downloaded again
+        self.window_cache = WindowCache.WindowCache(cache_dir, cache_max_bytes) if use_window_cache else None
+        # Per-stage instrumentation; with verbose=False a periodic progress line replaces the per-window prints
+        self.metrics = Metrics.Metrics()
+        self.verbose = verbose
+        self.metrics_dir = metrics_dir  # When set, metrics.json and metrics.prom are written there after a run
 
-    async def scrape_issuer(self, issuer_code: str, start_date: Optional[date] = None):
-        """Scrape data for a single issuer from a specified start date."""
-        try:
-            scraper = MSEStockScraper.MSEStockScraper(issuer_code)
-            today = datetime.now().date()
+    def create_scraper(self, issuer_code: str) -> MSEStockScraper.MSEStockScraper:
+        """Create a scraper that shares this run's session, limiter, cache and metrics."""
+        return MSEStockScraper.MSEStockScraper(issuer_code, session=self.session, limiter=self.limiter,
+                                               cache=self.window_cache, base_url=self.base_url,
+                                               metrics=self.metrics, verbose=self.verbose,
+                                               parse_executor=self.parse_executor)
+
+    def plan_work(self, update_info: Dict[str, Optional[date]]) -> List[Tuple[str, int, date, date]]:
+        """Split the whole (issuer x window) space into work items for a single queue.
+
+        Only windows the progress journal does not list as complete are planned, so an
+        interrupted backfill resumes exactly where it stopped.
+        """
+        today = datetime.now().date()
+        journal = self.db_manager.get_journal()
+        work_items = []
+        self.pending = {}
 
+        for issuer_code, start_date in update_info.items():
             # If no start_date was specified, default to fetching 10 years of data
             if not start_date:
-                start_date = today - pd.Timedelta(days=365 * 10)
+                start_date = today - timedelta(days=DatabaseManager.HISTORY_DAYS)
+
+            windows = self.db_manager.find_missing_windows(start_date, today, journal.get(issuer_code, {}))
+            if not windows:
+                continue
+
+            self.pending[issuer_code] = {
+                'scraper': self.create_scraper(issuer_code),
+                'rows': 0,
+                'remaining': len(windows),
+                # Issuers without any journaled window are backfilled; finding nothing at all is worth reporting
+                'backfill': issuer_code not in journal
+            }
+            for index, (window_start, window_end) in enumerate(windows):
+                work_items.append((issuer_code, index, window_start, window_end))
+
+        return work_items
+
+    def plan_market_days(self, update_info: Dict[str, Optional[date]]) -> Tuple[Dict[str, date],
+                                                                                Dict[str, Optional[date]]]:
+        """Split the issuers between market-wide day pages and per-issuer windows, for the fewest requests.
+
+        Fetching by day costs one request per trading day since the earliest gap it covers, whatever the
+        number of issuers; fetching per issuer costs one request per missing window. Issuers are taken
+        by day from the most recent gap backwards as long as that lowers the total. Issuers without
+        history always keep their per-issuer backfill. Returns (by-day issuers, remaining update_info).
+        """
+        today = datetime.now().date()
+        journal = self.db_manager.get_journal()
+        window_counts = {}
+        for issuer_code, start_date in update_info.items():
+            window_counts[issuer_code] = len(self.db_manager.find_missing_windows(
+                start_date or today - timedelta(days=DatabaseManager.HISTORY_DAYS), today,
+                journal.get(issuer_code, {})))
+
+        candidates = sorted(((start_date, issuer_code) for issuer_code, start_date in update_info.items()
+                             if start_date is not None and issuer_code in journal), reverse=True)
+        per_issuer = sum(window_counts.values())
+        best_cost, best_count = per_issuer, 0
+        for count, (start_date, issuer_code) in enumerate(candidates, 1):
+            per_issuer -= window_counts[issuer_code]
+            cost = per_issuer + len(MarketDayScraper.trading_days(start_date, today))
+            if cost < best_cost:
+                best_cost, best_count = cost, count
 
-            # Fetch data from the specified start_date to today
-            data = await scraper.scrape_historical_data(start_date, today)
+        by_day = {issuer_code: start_date for start_date, issuer_code in candidates[:best_count]}
+        remaining = {issuer_code: start_date for issuer_code, start_date in update_info.items()
+                     if issuer_code not in by_day}
+        return by_day, remaining
 
-            if data is not None and not data.empty:
-                # Clean the DataFrame
-                for col in data.columns:
-                    if col != 'Date':  # Skip date column
-                        data[col] = data[col].apply(MSEStockScraper.clean_numeric)
+    async def update_market_days(self, by_day: Dict[str, date]) -> Dict[str, date]:
+        """Catch issuers up from the market-wide page of every trading day since their gaps start.
 
-                # Save the data to the database
-                self.db_manager.save_data(data, issuer_code)
-            else:
-                async with self.error_lock:
-                    self.errors.append(f"No data retrieved for {issuer_code}")
+        Days are written in date order, each day's issuers in one transaction. The journal moves past a
+        day only when every earlier day was fetched. When a day fails (also a weekday holiday, whose page
+        has no table) the issuers it leaves behind are returned with the day they are covered from, for
+        the per-issuer windows to finish in the same run.
+        """
+        today = datetime.now().date()
+        days = MarketDayScraper.trading_days(min(by_day.values()), today)
+        scraper = MarketDayScraper.MarketDayScraper(self.market_day_url, base_url=self.base_url,
+                                                    session=self.session, limiter=self.limiter,
+                                                    cache=self.window_cache, metrics=self.metrics,
+                                                    verbose=self.verbose, parse_executor=self.parse_executor)
+        self.metrics.total_windows += len(days)
+        results = await asyncio.gather(*[scraper.scrape_day(day) for day in days], return_exceptions=True)
 
-        except Exception as e:
+        covered = {issuer_code: start_date - timedelta(days=1) for issuer_code, start_date in by_day.items()}
+        rows = 0
+        for index, (day, result) in enumerate(zip(days, results)):
+            self.metrics.increment('windows_done')
+            if isinstance(result, Exception):
+                self.metrics.increment('market_day_fallbacks', issuer_code=MarketDayScraper.MARKET_CODE)
+                self.metrics.total_windows -= len(days) - index - 1  # The later days are not used
+                behind = {issuer_code: covered_through + timedelta(days=1)
+                          for issuer_code, covered_through in covered.items() if covered_through < today}
+                print(f"Market page of {day} unavailable ({str(result)}); "
+                      f"fetching {len(behind)} issuers by symbol instead")
+                return behind
+            data, entries = self.market_day_batch(day, result, covered)
+            await self.writer.submit_batch_async(data, entries)
+            rows += len(data)
+            self.metrics.increment('rows_scraped', len(data), MarketDayScraper.MARKET_CODE)
+            if not self.verbose:
+                self.metrics.progress()
+
+        # Days after the last trading day (a weekend) have nothing to fetch
+        data, entries = self.market_day_batch(today, None, covered)
+        await self.writer.submit_batch_async(data, entries)
+        if self.verbose:
+            print(f"Scraped {rows} rows for {len(by_day)} issuers from {len(days)} market pages")
+        return {}
+
+    def market_day_batch(self, day: date, data: Optional[StockRows.StockRows],
+                         covered: Dict[str, date]) -> Tuple[StockRows.StockRows, List[tuple]]:
+        """Rows of one market page for the issuers behind it, and their journal entries up to the day.
+
+        covered holds the last covered day per issuer and is moved on to the day.
+        """
+        no_trades = StockRows.StockRows.empty_rows()
+        behind = [issuer_code for issuer_code, covered_through in covered.items() if covered_through < day]
+        by_issuer = {}
+        if data is None:
+            data = no_trades
+        else:
+            data = data.for_issuers(behind)
+            by_issuer = {issuer_code: data.select(data.issuer_codes == issuer_code)
+                         for issuer_code in set(data.issuer_codes.tolist())}
+
+        entries = []
+        for issuer_code in behind:
+            # The weekend skipped before the day may fall into the previous year's journal window
+            window_from = covered[issuer_code] + timedelta(days=1)
+            for year in range(window_from.year, day.year + 1):
+                window_end = min(day, date(year, 12, 31))
+                trades = by_issuer.get(issuer_code, no_trades) if window_end == day else no_trades
+                entries.append(self.db_manager.journal_entry(
+                    issuer_code, max(window_from, date(year, 1, 1)), window_end, trades))
+            covered[issuer_code] = day
+        return data, entries
+
+    async def store_issuer_data(self, issuer_code: str, data: Optional[StockRows.StockRows],
+                                window: Tuple[date, date]):
+        """Hand scraped rows to the database writer together with their window, which is journaled in the
+        same transaction, even if empty."""
+        has_data = data is not None and not data.empty
+
+        # Save the data to the database, off the event loop when the background writer is running.
+        # Empty results are passed on as they are: the journal tells an empty table from a missing one.
+        if self.writer is not None:
+            await self.writer.submit_async(data, issuer_code, window)
+        else:
+            self.db_manager.save_data(data, issuer_code, window)
+        return has_data
+
+    async def iter_work(self, work_items: List[Tuple[str, int, date, date]]) -> AsyncIterator[tuple]:
+        """Yield the planned windows as stage items (issuer, window start, window end, payload)."""
+        for issuer_code, _, window_start, window_end in work_items:
+            # The payload of the fetch stage is the time the window entered the pipeline
+            yield issuer_code, window_start, window_end, time.perf_counter()
+
+    async def feed_stage(self, work: AsyncIterator[tuple], outbox: asyncio.Queue, downstream_workers: int):
+        """Push work into the first stage; blocks whenever the fetchers are saturated."""
+        try:
+            async for item in work:
+                await outbox.put(item)
+        finally:
+            for _ in range(downstream_workers):
+                await outbox.put(None)  # One sentinel per downstream worker
+
+    async def run_stage(self, workers: int, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue],
+                        handler: Callable[[str, date, date, object], Awaitable], downstream_workers: int = 0):
+        """Run one pipeline stage with its own worker count between two bounded queues."""
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is None:
+                    break
+                issuer_code, window_start, window_end, payload = item
+                try:
+                    result = await handler(issuer_code, window_start, window_end, payload)
+                except Exception as e:
+                    # The window leaves the pipeline here; it is not journaled, so the next run retries it
+                    self.metrics.increment('errors', issuer_code=issuer_code)
+                    async with self.error_lock:
+                        self.errors.append(f"Error scraping {issuer_code}: {str(e)}")
+                    await self.window_done(issuer_code)
+                    continue
+                if outbox is not None:
+                    await outbox.put((issuer_code, window_start, window_end, result))
+
+        try:
+            await asyncio.gather(*[worker() for _ in range(workers)])
+        finally:
+            if outbox is not None:
+                for _ in range(downstream_workers):
+                    await outbox.put(None)
+
+    async def fetch_stage(self, issuer_code: str, window_start: date, window_end: date, queued_at: float) -> str:
+        """Download the page of one window; the shared controller bounds the requests in flight."""
+        self.metrics.observe('queue_wait', time.perf_counter() - queued_at, issuer_code)
+        return await self.pending[issuer_code]['scraper'].fetch_window(window_start, window_end)
+
+    async def parse_stage(self, issuer_code: str, window_start: date, window_end: date,
+                          html: str) -> Optional[StockRows.StockRows]:
+        """Parse a page into typed rows off the event loop so fetching continues meanwhile."""
+        scraper = self.pending[issuer_code]['scraper']
+        if scraper.parse_executor is not None:
+            return await scraper.parse_window(html)
+        return await asyncio.to_thread(scraper.parse_html, html)
+
+    async def write_stage(self, issuer_code: str, window_start: date, window_end: date,
+                          data: Optional[StockRows.StockRows]):
+        """Hand one window, with its journal entry, to the writer; waits while the writer's queue is full."""
+        state = self.pending[issuer_code]
+        if await self.store_issuer_data(issuer_code, data, (window_start, window_end)):
+            state['rows'] += len(data)
+            self.metrics.increment('rows_scraped', len(data), issuer_code)
+            if self.verbose:
+                print(f"Scraped {len(data)} rows from {window_start} to {window_end} for {issuer_code}")
+        else:
+            self.metrics.increment('empty_windows', issuer_code=issuer_code)
+            if self.verbose:
+                print(f"No data found from {window_start} to {window_end} for {issuer_code}")
+        await self.window_done(issuer_code)
+
+    async def window_done(self, issuer_code: str):
+        """Count one finished (or failed) window and complete the issuer after its last one."""
+        state = self.pending[issuer_code]
+        state['remaining'] -= 1
+        self.metrics.increment('windows_done')
+        if not self.verbose:
+            self.metrics.progress()
+        if state['remaining'] == 0:
+            await self.finish_issuer(issuer_code, state)
+
+    async def finish_issuer(self, issuer_code: str, state: Dict):
+        """Report an issuer once all of its windows are done."""
+        del self.pending[issuer_code]
+        if state['rows']:
+            if self.verbose:
+                print(f"Successfully scraped {state['rows']} rows in total for code: {issuer_code}")
+        elif state['backfill']:
             async with self.error_lock:
-                self.errors.append(f"Error scraping {issuer_code}: {str(e)}")
+                self.errors.append(f"No data retrieved for {issuer_code}")
+
+    async def run_pipeline(self, work_items: List[Tuple[str, int, date, date]], fetch_workers: int):
+        """Stream the planned windows through fetch -> parse -> write."""
+        fetch_queue = asyncio.Queue(maxsize=self.stage_queue_size)
+        parse_queue = asyncio.Queue(maxsize=self.stage_queue_size)
+        write_queue = asyncio.Queue(maxsize=self.stage_queue_size)
+        # Keep every pool process busy
+        parse_workers = max(self.parse_workers, self.parse_processes)
+        await asyncio.gather(
+            self.feed_stage(self.iter_work(work_items), fetch_queue, fetch_workers),
+            self.run_stage(fetch_workers, fetch_queue, parse_queue, self.fetch_stage, parse_workers),
+            self.run_stage(parse_workers, parse_queue, write_queue, self.parse_stage, 1),
+            # A single write worker keeps the writer's submission order; its bounded queue is the backpressure
+            self.run_stage(1, write_queue, None, self.write_stage)
+        )
 
-    async def process_queue(self):
-        """Process items from the queue asynchronously."""
-        while True:
+    def report_run(self):
+        """Print the run summary and export the metrics."""
+        if not self.verbose:
+            self.metrics.progress(force=True)
+
+        controller_stats = self.limiter.stats()
+        for name in ('requests_per_sec', 'average_concurrency', 'limit', 'lowest_limit', 'highest_limit'):
+            self.metrics.set_gauge(f"controller_{name}", controller_stats[name])
+        self.metrics.set_gauge('writer_rows_written', self.writer.rows_written)
+        self.metrics.set_gauge('writer_transactions', self.writer.transactions)
+        if self.window_cache is not None:
+            for name, value in self.window_cache.stats().items():
+                self.metrics.set_gauge(f"window_cache_{name}", value)
+
+        print(f"\n{self.limiter.report()}")
+        print(self.writer.report())
+        if self.window_cache is not None:
+            print(self.window_cache.report())
+        print(self.metrics.report())
+
+        if self.metrics_dir:
             try:
-                issuer_code, start_date = self.queue.get_nowait()
-                await self.scrape_issuer(issuer_code, start_date)
-                self.queue.task_done()
-            except Empty:
-                break
-            except Exception as e:
-                async with self.error_lock:
-                    self.errors.append(f"Queue processing error: {str(e)}")
-                self.queue.task_done()
+                self.metrics.export(self.metrics_dir)
+                print(f"Metrics written to {self.metrics_dir}")
+            except OSError as e:
+                print(f"Could not write metrics to {self.metrics_dir}: {e}")
+
+    async def open(self):
+        """Open the pooled session and the parse process pool for several runs (e.g. a daemon's cycles).
+
+        update_data opens them for the length of a run when they are not open yet; close() releases them.
+        """
+        if self.session is not None:
+            return
+        # One pooled session so connections are reused across issuers
+        self.session = MSEStockScraper.create_session(
+            connection_limit=self.connection_limit,
+            limit_per_host=self.limit_per_host,
+            dns_cache_ttl=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        if self.parse_processes > 0:
+            # Spawned workers only import the parser; forking would copy the writer thread's state
+            self.parse_executor = ProcessPoolExecutor(max_workers=self.parse_processes,
+                                                      mp_context=multiprocessing.get_context('spawn'))
+
+    async def close(self):
+        """Close the session and shut down the parse process pool."""
+        if self.parse_executor is not None:
+            self.parse_executor.shutdown()
+            self.parse_executor = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
 
     async def update_data(self, update_info: Dict[str, Optional[datetime]], max_concurrent_tasks: int = 200):
         """Update data for all issuers that need updating."""
-        # Clear previous errors
+        # Clear previous errors and metrics
         self.errors = []
+        self.metrics = Metrics.Metrics()
 
-        # Fill queue with work items
-        for issuer_code, last_date in update_info.items():
-            self.queue.put((issuer_code, last_date))
+        # All writes of this run go through a single background writer thread
+        self.writer = DatabaseWriter.DatabaseWriter(self.db_manager, metrics=self.metrics)
+        self.writer.start()
 
-        # Create and start worker tasks
-        tasks = [self.process_queue() for _ in range(min(max_concurrent_tasks, len(update_info)))]
-
-        # Run tasks concurrently
-        await asyncio.gather(*tasks)
+        # Pools opened by the caller stay open after the run
+        owns_pools = self.session is None
+        await self.open()
+        self.limiter = ConcurrencyController.ConcurrencyController(
+            initial_limit=min(self.initial_concurrency, max_concurrent_tasks),
+            max_limit=max_concurrent_tasks,
+            target_latency=self.target_latency
+        )
+        try:
+            if self.market_day_url is not None:
+                by_day, update_info = self.plan_market_days(update_info)
+                if by_day:
+                    # Issuers a failed day left behind go on with their own windows
+                    update_info.update(await self.update_market_days(by_day))
+            # One work item per (issuer, window), streamed through the stages
+            work_items = self.plan_work(update_info)
+            self.metrics.total_windows += len(work_items)
+            if work_items:
+                await self.run_pipeline(work_items, min(max_concurrent_tasks, len(work_items)))
+        finally:
+            if owns_pools:
+                await self.close()
+            # Flush the remaining rows before reporting
+            await asyncio.to_thread(self.writer.stop)
+            self.errors.extend(self.writer.errors)
+            self.report_run()
+            self.limiter = None
+            self.writer = None
 
         # Report any errors that occurred
         if self.errors:
@@ -1,126 +1,755 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from datetime import datetime, date, timedelta
+import numpy as np
 import pandas as pd
 import sqlite3
+import Analytics
+import FrameCache
+import Snapshot
+import StockColumns
+import StockRows
+
+# Columns of the stock_data table, in order
+STOCK_COLUMNS = ['issuer_code', 'Date'] + StockColumns.VALUE_COLUMNS
+
+NUMERIC_COLUMNS = StockColumns.VALUE_COLUMNS
+
+# Idempotent write: re-scraped rows overwrite the stored values instead of failing on the primary key
+UPSERT_SQL = '''
+    INSERT INTO stock_data (issuer_code, "Date", "Last Trade Price", "Max", "Min", "Volume",
+                            "Turnover in BEST (denars)")
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (issuer_code, "Date") DO UPDATE SET
+        "Last Trade Price" = excluded."Last Trade Price",
+        "Max" = excluded."Max",
+        "Min" = excluded."Min",
+        "Volume" = excluded."Volume",
+        "Turnover in BEST (denars)" = excluded."Turnover in BEST (denars)"
+'''
+
+# Compact layout: issuer codes live once in a dimension table and dates are day numbers (days since
+# 1970-01-01), clustered by (issuer_id, day) in a WITHOUT ROWID table so an issuer's history is one range scan
+COMPACT_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS issuers (
+        issuer_id INTEGER PRIMARY KEY,
+        issuer_code TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS stock_rows (
+        issuer_id INTEGER NOT NULL REFERENCES issuers (issuer_id),
+        day INTEGER NOT NULL,
+        last_trade_price REAL,
+        max_price REAL,
+        min_price REAL,
+        volume REAL,
+        turnover_best REAL,
+        PRIMARY KEY (issuer_id, day)
+    ) WITHOUT ROWID;
+    -- Compatibility view with the columns of the original stock_data table, for existing readers
+    CREATE VIEW IF NOT EXISTS stock_data AS
+        SELECT i.issuer_code AS issuer_code,
+               date(r.day * 86400, 'unixepoch') AS "Date",
+               r.last_trade_price AS "Last Trade Price",
+               r.max_price AS "Max",
+               r.min_price AS "Min",
+               r.volume AS "Volume",
+               r.turnover_best AS "Turnover in BEST (denars)"
+        FROM stock_rows r JOIN issuers i ON i.issuer_id = r.issuer_id;
+    -- Writers that still insert into stock_data are redirected to the compact tables
+    CREATE TRIGGER IF NOT EXISTS stock_data_insert INSTEAD OF INSERT ON stock_data
+    BEGIN
+        INSERT OR IGNORE INTO issuers (issuer_code) VALUES (NEW.issuer_code);
+        INSERT INTO stock_rows (issuer_id, day, last_trade_price, max_price, min_price, volume, turnover_best)
+        VALUES ((SELECT issuer_id FROM issuers WHERE issuer_code = NEW.issuer_code),
+                CAST(julianday(NEW."Date") - 2440587.5 AS INTEGER),
+                NEW."Last Trade Price", NEW."Max", NEW."Min", NEW."Volume", NEW."Turnover in BEST (denars)")
+        ON CONFLICT (issuer_id, day) DO UPDATE SET
+            last_trade_price = excluded.last_trade_price,
+            max_price = excluded.max_price,
+            min_price = excluded.min_price,
+            volume = excluded.volume,
+            turnover_best = excluded.turnover_best;
+    END;
+'''
+
+COMPACT_UPSERT_SQL = '''
+    INSERT INTO stock_rows (issuer_id, day, last_trade_price, max_price, min_price, volume, turnover_best)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (issuer_id, day) DO UPDATE SET
+        last_trade_price = excluded.last_trade_price,
+        max_price = excluded.max_price,
+        min_price = excluded.min_price,
+        volume = excluded.volume,
+        turnover_best = excluded.turnover_best
+'''
+
+# Copies a row-store stock_data table (renamed to stock_data_legacy) into the compact tables
+COMPACT_MIGRATION_SQL = '''
+    INSERT OR IGNORE INTO issuers (issuer_code)
+        SELECT DISTINCT issuer_code FROM stock_data_legacy WHERE issuer_code IS NOT NULL ORDER BY issuer_code;
+    INSERT OR REPLACE INTO stock_rows (issuer_id, day, last_trade_price, max_price, min_price, volume, turnover_best)
+        SELECT i.issuer_id, CAST(julianday(l."Date") - 2440587.5 AS INTEGER) AS day,
+               l."Last Trade Price", l."Max", l."Min", l."Volume", l."Turnover in BEST (denars)"
+        FROM stock_data_legacy l JOIN issuers i ON i.issuer_code = l.issuer_code
+        WHERE julianday(l."Date") IS NOT NULL
+        ORDER BY i.issuer_id, day;
+    DROP TABLE stock_data_legacy;
+'''
+
+# Progress journal: one row per (issuer, calendar-year window) with the part of the window already stored.
+# status records what the fetches found: 'data', 'empty' (a table without rows) or 'no_table'; a window
+# that held data once keeps 'data'. A page without a table may be a transient error page, so a 'no_table'
+# window is fetched again; only a second fetch without a table confirms it ('no_table_confirmed').
+# A page with rows whose date could not be parsed makes a 'partial' window, which is fetched again
+# until a fetch stores every row. Windows with data and confirmed-empty windows are never requested
+# again once they are closed.
+JOURNAL_UPSERT_SQL = '''
+    INSERT INTO scrape_journal (issuer_code, window_start, covered_from, fetched_through, updated_at, status)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (issuer_code, window_start) DO UPDATE SET
+        covered_from = MIN(scrape_journal.covered_from, excluded.covered_from),
+        fetched_through = MAX(scrape_journal.fetched_through, excluded.fetched_through),
+        updated_at = excluded.updated_at,
+        status = CASE WHEN excluded.status = 'partial' THEN 'partial'
+                      WHEN scrape_journal.status = 'data' THEN 'data'
+                      WHEN excluded.status = 'no_table' THEN
+                          CASE WHEN scrape_journal.status IN ('no_table', 'no_table_confirmed')
+                               THEN 'no_table_confirmed' ELSE 'no_table' END
+                      ELSE COALESCE(excluded.status, scrape_journal.status) END
+'''
+
+# Activity index: the last trade seen for an issuer, when it was last checked and whether the listing has it
+ACTIVITY_UPSERT_SQL = '''
+    INSERT INTO issuer_activity (issuer_code, last_trade_date, last_checked, listed)
+    VALUES (?, ?, ?, 1)
+    ON CONFLICT (issuer_code) DO UPDATE SET
+        last_trade_date = COALESCE(MAX(issuer_activity.last_trade_date, excluded.last_trade_date),
+                                   issuer_activity.last_trade_date, excluded.last_trade_date),
+        last_checked = COALESCE(excluded.last_checked, issuer_activity.last_checked)
+'''
+
+# How far back a full backfill reaches
+HISTORY_DAYS = 365 * 10
+
+# Issuers without a trade for this long are dormant and their daily tail is fetched less often
+DORMANT_AFTER_DAYS = 30
+# Longest pause between two checks of a dormant issuer
+MAX_RECHECK_DAYS = 28
+
+def window_start_of(day: date) -> date:
+    """Backfill windows are calendar years, so the same window is planned on every run."""
+    return date(day.year, 1, 1)
+
+
+def recheck_interval(idle_days: int) -> int:
+    """Days between checks of a dormant issuer: the longer it has not traded, the less often it is asked."""
+    return min(MAX_RECHECK_DAYS, max(1, idle_days // 7))
+
+
+def window_status(rows: Optional[StockRows.StockRows]) -> str:
+    """Journal status of a fetched window: None means the page had no results table, and rows that lost
+    some of the page's rows (an unparsable date) only make a 'partial' window."""
+    if rows is None:
+        return 'no_table'
+    if rows.dropped:
+        return 'partial'
+    return 'empty' if rows.empty else 'data'
+
+
+def is_trusted(entry: Tuple[date, date, Optional[str]]) -> bool:
+    """Whether a journal entry counts as fetched; a single fetch without a results table and a partial
+    page do not."""
+    return entry[2] not in ('no_table', 'partial')
+
+
+def trusted_through(journal: Dict[date, Tuple[date, date, Optional[str]]]) -> Optional[date]:
+    """The newest date an issuer's trusted journal windows were fetched through, or None."""
+    return max((entry[1] for entry in journal.values() if is_trusted(entry)), default=None)
+
+
+def format_numbers(values) -> np.ndarray:
+    """Format a numeric column as '1,234.50' strings; missing values stay NaN.
+
+    The missing-value mask is computed once for the whole column and only present values are formatted,
+    with one bound str.format over a plain list (numpy's string functions are slower than this).
+    """
+    numbers = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype='float64')
+    formatted = np.full(len(numbers), np.nan, dtype=object)
+    present = ~np.isnan(numbers)
+    formatted[present] = list(map('{:,.2f}'.format, numbers[present].tolist()))
+    return formatted
+
+
+def from_row_date(value) -> Optional[date]:
+    """Date of a prepared row: an ISO string, or a day number in the compact layout."""
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return StockColumns.from_day(int(value))
+    return date.fromisoformat(str(value)[:10])
 
 
 class DatabaseManager:
     """Second pipe: Manage SQLite database operations and check data currency."""
 
-    def __init__(self, db_path: str = 'mse_stocks.db'):
+    def __init__(self, db_path: str = 'mse_stocks.db', mmap_size: int = 256 * 1024 * 1024,
+                 cache_size_kb: int = 64 * 1024, compact: bool = False, frame_cache_size: int = 256,
+                 analytics: bool = True):
         self.db_path = db_path
+        # Compact layout (issuers + stock_rows behind a stock_data view). A database that already has it keeps
+        # using it; compact=True creates it for new databases and migrates an existing stock_data table.
+        self.compact = compact
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
         # Delete existing database to ensure clean schema (USED ONLY FOR DEBUGGING)
         # if os.path.exists(db_path):
         #     os.remove(db_path)
+        # Whole per-issuer frames behind query(); writes through save_data or a DatabaseWriter invalidate them
+        self.frame_cache = FrameCache.FrameCache(frame_cache_size)
+        # Derived return / moving-average / OHLC tables, updated in the transaction of every write
+        self.analytics = Analytics.AnalyticsStore(self) if analytics else None
+        # One long-lived connection is reused by every method instead of reconnecting per call
+        self.conn = self.connect()
         self.setup_database()
 
+    def connect(self) -> sqlite3.Connection:
+        """Open a connection tuned for this workload (WAL, memory-mapped reads, larger page cache)."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")  # Readers no longer block on writes
+        conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL and avoids an fsync per commit
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")  # Negative value means KiB
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def close(self):
+        """Close the long-lived connection."""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
     def setup_database(self):
         """Create database and tables if they don't exist."""
-        with sqlite3.connect(self.db_path) as conn:
+        stock_data_type = self.conn.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'stock_data'").fetchone()
+        if stock_data_type and stock_data_type[0] == 'view':
+            self.compact = True
+        elif self.compact and stock_data_type:
+            self.migrate_to_compact()
+
+        if self.compact:
+            self.conn.executescript(COMPACT_SCHEMA_SQL)
+
+        with self.conn as conn:
             cursor = conn.cursor()
+            if not self.compact:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS stock_data (
+                        issuer_code TEXT,
+                        "Date" DATE,
+                        "Last Trade Price" REAL,
+                        "Max" REAL,
+                        "Min" REAL,
+                        "Volume" REAL,
+                        "Turnover in BEST (denars)" REAL,
+                        PRIMARY KEY (issuer_code, "Date")
+                    )
+                ''')
+            journal_exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'scrape_journal'"
+            ).fetchone()
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS stock_data (
+                CREATE TABLE IF NOT EXISTS scrape_journal (
                     issuer_code TEXT,
-                    "Date" DATE,
-                    "Last Trade Price" REAL,
-                    "Max" REAL,
-                    "Min" REAL,
-                    "Volume" REAL,
-                    "Turnover in BEST (denars)" REAL,
-                    PRIMARY KEY (issuer_code, "Date")
+                    window_start DATE,
+                    covered_from DATE,
+                    fetched_through DATE,
+                    updated_at TEXT,
+                    status TEXT,
+                    PRIMARY KEY (issuer_code, window_start)
                 )
             ''')
-            conn.commit()
+            journal_columns = [row[1] for row in cursor.execute("PRAGMA table_info(scrape_journal)")]
+            if 'status' not in journal_columns:
+                cursor.execute("ALTER TABLE scrape_journal ADD COLUMN status TEXT")
+            if not journal_exists:
+                self.seed_journal(conn)
+
+            activity_exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'issuer_activity'"
+            ).fetchone()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS issuer_activity (
+                    issuer_code TEXT PRIMARY KEY,
+                    last_trade_date DATE,
+                    last_checked TEXT,
+                    listed INTEGER DEFAULT 1
+                )
+            ''')
+            if not activity_exists:
+                # Start from the stored history; last_checked stays empty so every issuer is checked once
+                self.record_activity(conn, self.get_last_dates())
+
+            # Counter bumped by every write of rows; readers such as the query service key their caches on it
+            cursor.execute("CREATE TABLE IF NOT EXISTS ingest_state (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                           "version INTEGER NOT NULL)")
+            cursor.execute("INSERT OR IGNORE INTO ingest_state (id, version) VALUES (1, 0)")
+
+        if self.analytics is not None:
+            if self.analytics.setup(self.conn):
+                # New derived tables start from everything already stored
+                with self.conn as conn:
+                    self.analytics.rebuild(conn, self.get_last_dates())
+            else:
+                # Tails left pending by a run that stopped before applying them
+                self.apply_analytics()
+
+    def migrate_to_compact(self):
+        """Move the rows of a row-store stock_data table into the compact layout, then reclaim the space."""
+        try:
+            # One script in one transaction: either every row moved and the old table is gone, or nothing changed
+            self.conn.executescript("BEGIN; ALTER TABLE stock_data RENAME TO stock_data_legacy;"
+                                    + COMPACT_SCHEMA_SQL + COMPACT_MIGRATION_SQL + "COMMIT;")
+        except sqlite3.Error as e:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            print(f"Error migrating {self.db_path} to the compact schema: {str(e)}")
+            raise
+        self.conn.execute("VACUUM")
+        self.compact = True
+
+    def seed_journal(self, conn: sqlite3.Connection):
+        """Journal the data of a database created before the journal existed.
+
+        Everything up to an issuer's last stored date counts as fetched, which is what the
+        previous MAX(date) based currency check assumed.
+        """
+        last_dates = {}
+        for issuer_code, last_date in conn.execute(
+                'SELECT issuer_code, MAX("Date") FROM stock_data GROUP BY issuer_code').fetchall():
+            if last_date:
+                last_dates[issuer_code] = datetime.strptime(last_date, "%Y-%m-%d").date()
+        self.journal_history(conn, last_dates)
+
+    def journal_history(self, conn: sqlite3.Connection, last_dates: Dict[str, date],
+                        first_dates: Optional[Dict[str, date]] = None):
+        """Mark every window up to each issuer's last date as fetched, from the backfill horizon or,
+        when given, from the issuer's first date (the windows before it stay missing)."""
+        today = datetime.now().date()
+        horizon = date((today - timedelta(days=HISTORY_DAYS)).year, 1, 1)
+        entries = []
+        for issuer_code, last_date in last_dates.items():
+            first_date = first_dates[issuer_code] if first_dates is not None else horizon
+            for year in range(first_date.year, last_date.year + 1):
+                covered_from = max(date(year, 1, 1), first_date)
+                fetched_through = min(date(year, 12, 31), last_date)
+                entries.append((issuer_code, date(year, 1, 1).isoformat(), covered_from.isoformat(),
+                                fetched_through.isoformat(), datetime.now().isoformat(timespec='seconds'), None))
+        conn.executemany(JOURNAL_UPSERT_SQL, entries)
+
+    def record_journal(self, conn: sqlite3.Connection, journal: Dict[str, List[list]]):
+        """Merge journal windows exported with a snapshot (issuer -> [window_start, covered_from,
+        fetched_through, status] lists); windows this database fetched further are kept."""
+        updated_at = datetime.now().isoformat(timespec='seconds')
+        conn.executemany(JOURNAL_UPSERT_SQL, [
+            (issuer_code, window_start, covered_from, fetched_through, updated_at, status)
+            for issuer_code, windows in journal.items()
+            for window_start, covered_from, fetched_through, status in windows
+        ])
 
     def get_last_date(self, issuer_code: str) -> Optional[date]:
         """Get the last recorded date for an issuer."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row  # This allows fetching results as dictionaries
-            cursor = conn.cursor()
+        cursor = self.conn.cursor()
+        if self.compact:
+            # MAX over the clustered key instead of formatting every date through the view
             cursor.execute(
-                "SELECT MAX(date) AS max_date FROM stock_data WHERE issuer_code = ?",
+                "SELECT date(MAX(r.day) * 86400, 'unixepoch') FROM stock_rows r "
+                "JOIN issuers i ON i.issuer_id = r.issuer_id WHERE i.issuer_code = ?",
                 (issuer_code,)
             )
-            result = cursor.fetchone()
-            if result and result['max_date']:
-                return datetime.strptime(result['max_date'], "%Y-%m-%d").date()
-            else:
-                return None
+        else:
+            cursor.execute(
+                'SELECT MAX("Date") AS max_date FROM stock_data WHERE issuer_code = ?',
+                (issuer_code,)
+            )
+        result = cursor.fetchone()
+        if result and result[0]:
+            return datetime.strptime(result[0], "%Y-%m-%d").date()
+        else:
+            return None
+
+    def get_last_dates(self) -> Dict[str, date]:
+        """Get the last recorded date for every issuer in a single pass over the primary-key index."""
+        cursor = self.conn.cursor()
+        if self.compact:
+            cursor.execute("SELECT i.issuer_code, date(MAX(r.day) * 86400, 'unixepoch') FROM stock_rows r "
+                           "JOIN issuers i ON i.issuer_id = r.issuer_id GROUP BY r.issuer_id")
+        else:
+            cursor.execute('SELECT issuer_code, MAX("Date") FROM stock_data GROUP BY issuer_code')
+        return {
+            issuer_code: datetime.strptime(max_date, "%Y-%m-%d").date()
+            for issuer_code, max_date in cursor.fetchall()
+            if max_date
+        }
+
+    def get_journal(self) -> Dict[str, Dict[date, Tuple[date, date, Optional[str]]]]:
+        """Load the progress journal: issuer -> window start -> (covered_from, fetched_through, status)."""
+        journal = {}
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT issuer_code, window_start, covered_from, fetched_through, status FROM scrape_journal")
+        for issuer_code, window_start, covered_from, fetched_through, status in cursor.fetchall():
+            journal.setdefault(issuer_code, {})[date.fromisoformat(window_start)] = (
+                date.fromisoformat(covered_from), date.fromisoformat(fetched_through), status
+            )
+        return journal
+
+    def find_missing_windows(self, start_date: date, end_date: date,
+                             journal: Dict[date, Tuple[date, date, Optional[str]]]) -> List[Tuple[date, date]]:
+        """Date ranges between start_date and end_date that no completed window of the journal covers.
+
+        Interior gaps left by an interrupted backfill show up here as well, unlike with MAX(date).
+        A window fetched once without a results table is missing as a whole until a recheck confirms it.
+        """
+        missing = []
+        for year in range(start_date.year, end_date.year + 1):
+            window_start = date(year, 1, 1)
+            needed_from = max(start_date, window_start)
+            needed_to = min(end_date, date(year, 12, 31))
+            entry = journal.get(window_start)
+            if entry is None or not is_trusted(entry) or entry[0] > needed_from:
+                missing.append((needed_from, needed_to))
+            elif entry[1] < needed_to:
+                # Only the tail after the last fetch is missing
+                missing.append((max(needed_from, entry[1] + timedelta(days=1)), needed_to))
+        return missing
+
+    def get_activity(self) -> Dict[str, Tuple[Optional[date], Optional[datetime], bool]]:
+        """Load the activity index: issuer -> (last trade date, last checked, listed)."""
+        activity = {}
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT issuer_code, last_trade_date, last_checked, listed FROM issuer_activity")
+        for issuer_code, last_trade_date, last_checked, listed in cursor.fetchall():
+            activity[issuer_code] = (
+                date.fromisoformat(last_trade_date) if last_trade_date else None,
+                datetime.fromisoformat(last_checked) if last_checked else None,
+                bool(listed)
+            )
+        return activity
 
-    def check_data_currency(self, codes: List[str]) -> Dict[str, Optional[date]]:
-        """Check which issuers need updating and their start dates for scraping."""
-        today = datetime.now().date()  # Use only the date
-        ten_years_ago = today - timedelta(days=365 * 10)
+    def update_listing(self, codes: List[str]):
+        """Record which issuers the current listing contains; codes must be the complete listing, since
+        every other issuer is marked as no longer listed."""
+        with self.conn as conn:
+            conn.execute("UPDATE issuer_activity SET listed = 0")
+            conn.executemany(
+                "INSERT INTO issuer_activity (issuer_code, listed) VALUES (?, 1) "
+                "ON CONFLICT (issuer_code) DO UPDATE SET listed = 1",
+                [(code,) for code in codes]
+            )
+
+    def is_resting(self, journal: Dict[date, Tuple[date, date, Optional[str]]],
+                   activity: Optional[Tuple[Optional[date], Optional[datetime], bool]],
+                   missing: List[Tuple[date, date]], now: datetime) -> bool:
+        """Whether a dormant issuer can skip this run because it was checked recently enough.
+
+        Only a plain incremental update is skipped; gaps inside the history are always fetched. An
+        issuer the last full listing no longer contains rests for the longest interval right away.
+        """
+        fetched_through = trusted_through(journal)
+        if fetched_through is None or activity is None or activity[1] is None:
+            return False
+        if missing[0][0] <= fetched_through:
+            return False
+        last_trade_date, last_checked, listed = activity
+        idle_days = (now.date() - last_trade_date).days if last_trade_date else HISTORY_DAYS
+        if not listed:
+            return now - last_checked < timedelta(days=MAX_RECHECK_DAYS)
+        if idle_days < DORMANT_AFTER_DAYS:
+            return False
+        return now - last_checked < timedelta(days=recheck_interval(idle_days))
+
+    def check_data_currency(self, codes: List[str], tail_only: bool = False,
+                            from_listing: bool = False) -> Dict[str, Optional[date]]:
+        """Check which issuers need updating and their start dates for scraping.
+
+        With tail_only only the dates after each issuer's newest fetch are planned, and issuers without
+        any trusted journaled window (they need a full backfill) are left out. Pass from_listing=True
+        when codes is the exchange's complete current listing, to record which issuers it contains.
+        """
+        now = datetime.now()
+        today = now.date()  # Use only the date
+        ten_years_ago = today - timedelta(days=HISTORY_DAYS)
         update_info = {}
+        journal = self.get_journal()
+        if from_listing:
+            self.update_listing(codes)
+        activity = self.get_activity()
+        resting = 0
+        without_history = 0
 
         for code in codes:
-            last_date = self.get_last_date(code)
-            if not last_date:
-                # No data exists, start from 10 years ago
-                update_info[code] = ten_years_ago
-            elif last_date < today:
-                update_info[code] = last_date + timedelta(days=1)
+            if tail_only and trusted_through(journal.get(code, {})) is None:
+                without_history += 1
+                continue
+            # Start from the first window that is not complete; with no journal that is 10 years ago
+            missing = self.find_missing_windows(ten_years_ago, today, journal.get(code, {}))
+            if tail_only:
+                # Only what follows the newest fetch; gaps further back are left to a backfill
+                tail_from = trusted_through(journal[code]) + timedelta(days=1)
+                missing = [(max(start, tail_from), end) for start, end in missing if end >= tail_from]
+            if not missing:
+                continue
+            if self.is_resting(journal.get(code, {}), activity.get(code), missing, now):
+                resting += 1
+                continue
+            update_info[code] = missing[0][0]
 
+        if resting:
+            print(f"Skipping {resting} dormant issuers until their next check")
+        if without_history:
+            print(f"Skipping {without_history} issuers without history; they are fetched by a backfill")
         return update_info
 
-    def save_data(self, df: pd.DataFrame, issuer_code: str):
-        """Save data to SQLite database with proper formatting."""
-        try:
-            # Create a copy and cleanup data
-            save_df = df.copy()
-            save_df['issuer_code'] = issuer_code
+    def journal_entry(self, issuer_code: str, from_date: date, to_date: date,
+                      rows: Optional[StockRows.StockRows] = None) -> tuple:
+        """Journal row for a fetched range; today's data may still change, so it is fetched again next run.
+
+        The scraped rows (None when the page had no table) set the window's status and the issuer's
+        last trade; the extra last-trade field is split off again by record_windows.
+        """
+        today = datetime.now().date()
+        fetched_through = min(to_date, today - timedelta(days=1))
+        status = window_status(rows)
+        last_trade_date = rows.last_date().isoformat() if rows is not None and not rows.empty else None
+        return (issuer_code, window_start_of(from_date).isoformat(), from_date.isoformat(),
+                fetched_through.isoformat(), datetime.now().isoformat(timespec='seconds'), status,
+                last_trade_date)
+
+    def record_windows(self, conn: sqlite3.Connection, entries: List[tuple]):
+        """Mark fetched windows as done and refresh the activity index; call inside the transaction that
+        stored their rows."""
+        conn.executemany(JOURNAL_UPSERT_SQL, [entry[:6] for entry in entries])
+        conn.executemany(ACTIVITY_UPSERT_SQL, [(entry[0], entry[6], entry[4]) for entry in entries])
+
+    def record_activity(self, conn: sqlite3.Connection, last_dates: Dict[str, date]):
+        """Add known last trades to the activity index without marking the issuers as checked."""
+        conn.executemany(ACTIVITY_UPSERT_SQL, [(issuer_code, last_date.isoformat(), None)
+                                               for issuer_code, last_date in last_dates.items()])
+
+    def row_tuples(self, rows: StockRows.StockRows, issuer_code: Optional[str] = None) -> List[tuple]:
+        """Scraped rows as tuples in stock_data column order for this database's layout.
 
-            # Ensure all columns exist and are in the right order
-            required_columns = [
-                'issuer_code', 'Date', 'Last Trade Price', 'Max', 'Min',
-                'Volume', 'Turnover in BEST (denars)'
-            ]
+        Without an issuer_code the rows' own issuer codes are used (rows of many issuers).
+        """
+        return rows.tuples(self.compact, issuer_code)
 
-            # Create missing columns if needed
-            for col in required_columns:
-                if col not in save_df.columns:
-                    save_df[col] = None
+    def issuer_ids(self, conn: sqlite3.Connection, issuer_codes) -> Dict[str, int]:
+        """Ids of the given issuer codes in the compact layout, registering new codes."""
+        codes = list(set(issuer_codes))
+        conn.executemany("INSERT OR IGNORE INTO issuers (issuer_code) VALUES (?)", [(code,) for code in codes])
+        placeholders = ", ".join("?" * len(codes))
+        return dict(conn.execute(
+            f"SELECT issuer_code, issuer_id FROM issuers WHERE issuer_code IN ({placeholders})", codes).fetchall())
 
-            # Select and order only the required columns
-            save_df = save_df[required_columns]
+    def update_analytics(self, conn: sqlite3.Connection, rows: List[tuple]):
+        """Mark the derived tables' tail as stale for the issuers in a batch of written rows.
 
-            # Convert empty strings and 'None' strings to None
-            save_df = save_df.replace(['', 'None', 'NULL'], None)
+        Call inside the transaction that wrote the rows; apply_analytics recomputes the marked tails.
+        """
+        if self.analytics is None or not rows:
+            return
+        earliest = {}
+        for row in rows:
+            day = from_row_date(row[1])
+            if day is not None and (row[0] not in earliest or day < earliest[row[0]]):
+                earliest[row[0]] = day
+        self.analytics.mark_pending(conn, earliest)
 
-            # Convert numeric columns safely
-            numeric_columns = ['Last Trade Price', 'Max', 'Min', 'Volume', 'Turnover in BEST (denars)']
-            for col in numeric_columns:
-                save_df[col] = pd.to_numeric(save_df[col], errors='coerce')
+    def apply_analytics(self, conn: Optional[sqlite3.Connection] = None) -> int:
+        """Recompute the pending tails of the derived tables in one transaction.
 
-            # Convert date column
-            save_df['Date'] = pd.to_datetime(save_df['Date']).dt.date
+        A failure is reported without touching the rows themselves; the marks stay for the next attempt.
+        """
+        if self.analytics is None:
+            return 0
+        try:
+            with (conn or self.conn) as transaction:
+                return self.analytics.apply_pending(transaction)
+        except Exception as e:
+            print(f"Error updating analytics: {str(e)}")
+            return 0
+
+    def rebuild_analytics(self, issuer_codes: Optional[List[str]] = None):
+        """Recompute the derived tables from stock_data, for the given issuers or all of them."""
+        if self.analytics is None:
+            return
+        with self.conn as conn:
+            self.analytics.rebuild(conn, issuer_codes if issuer_codes is not None else self.get_last_dates())
+
+    def query_analytics(self, issuer_code: str, kind: str = 'daily', start_date: Optional[date] = None,
+                        end_date: Optional[date] = None) -> pd.DataFrame:
+        """Derived rows of an issuer: kind is 'daily' (returns, MA20/50/200), 'weekly' or 'monthly' (OHLC)."""
+        if self.analytics is None:
+            raise ValueError("Analytics tables are disabled for this database")
+        return self.analytics.read(self.conn, issuer_code, kind, start_date, end_date)
+
+    def ingest_version(self) -> int:
+        """Version of the stored rows; it changes with every write of rows from any connection."""
+        return self.conn.execute("SELECT version FROM ingest_state WHERE id = 1").fetchone()[0]
+
+    def bump_ingest_version(self, conn: sqlite3.Connection):
+        """Mark stored rows as changed; call inside the transaction that wrote them."""
+        conn.execute("UPDATE ingest_state SET version = version + 1 WHERE id = 1")
 
-            with sqlite3.connect(self.db_path) as conn:
-                save_df.to_sql('stock_data', conn, if_exists='append', index=False)
+    def upsert_rows(self, conn: sqlite3.Connection, rows: List[tuple]):
+        """Insert rows in one executemany call, updating rows that already exist for (issuer, date)."""
+        if not self.compact:
+            conn.executemany(UPSERT_SQL, rows)
+            return
+        if not rows:
+            return
+        # Upserts cannot target the stock_data view, so compact batches go straight to stock_rows
+        ids = self.issuer_ids(conn, (row[0] for row in rows))
+        conn.executemany(COMPACT_UPSERT_SQL, ((ids[row[0]],) + row[1:] for row in rows))
+
+    def save_data(self, data: Optional[StockRows.StockRows], issuer_code: str,
+                  window: Optional[Tuple[date, date]] = None):
+        """Save scraped rows to the SQLite database, journaling the window when one is given."""
+        try:
+            rows = self.row_tuples(data, issuer_code) if data is not None and not data.empty else []
+            with self.conn as conn:
+                self.upsert_rows(conn, rows)
+                self.update_analytics(conn, rows)
+                if rows:
+                    self.bump_ingest_version(conn)
+                if window is not None:
+                    self.record_windows(conn, [self.journal_entry(issuer_code, *window, data)])
+            if rows:
+                self.frame_cache.invalidate([issuer_code])
+                self.apply_analytics()
 
         except Exception as e:
             print(f"Error saving data for {issuer_code}: {str(e)}")
             raise
 
-    def fetch_sample_data(self, issuer_code: Optional[str] = None, limit: int = 100):
-        """Fetch a sample of data from the stock_data table, optionally filtered by issuer code."""
-        with sqlite3.connect(self.db_path) as conn:
-            # Construct the query with an optional WHERE clause
-            if issuer_code:
-                query = "SELECT * FROM stock_data WHERE issuer_code = ? LIMIT ?" #Show empty rows
-                #query = "SELECT * FROM stock_data WHERE issuer_code = ? AND Volume > 0 LIMIT ?" #hide empty rows
-                params = (issuer_code, limit)
-            else:
-                query = "SELECT * FROM stock_data WHERE Volume > 0 LIMIT ?"
-                params = (limit,)
+    def export_snapshot(self, directory: str, issuer_codes: Optional[List[str]] = None,
+                        fmt: Optional[str] = None, compression: Optional[str] = 'zstd') -> Dict:
+        """Write stock_data to a per-issuer columnar snapshot; see Snapshot.export_snapshot."""
+        return Snapshot.export_snapshot(self, directory, issuer_codes, fmt, compression)
 
-            # Execute the query with the provided parameters
-            df = pd.read_sql_query(query, conn, params=params)
+    def import_snapshot(self, directory: str) -> Dict[str, int]:
+        """Bulk-load a snapshot and seed the journal so updates continue after it; see Snapshot.import_snapshot."""
+        try:
+            return Snapshot.import_snapshot(self, directory)
+        except Exception as e:
+            print(f"Error importing snapshot from {directory}: {str(e)}")
+            raise
+
+    def load_issuer_frame(self, issuer_code: str, start_date: Optional[date] = None,
+                          end_date: Optional[date] = None,
+                          conn: Optional[sqlite3.Connection] = None) -> pd.DataFrame:
+        """Rows of one issuer in date order, read as a single range scan of the primary key.
+
+        Pass conn to read through another connection, e.g. inside the writer's open transaction.
+        """
+        if self.compact:
+            selected = ", ".join(f"r.{name}" for name in StockColumns.COMPACT_NAMES.values())
+            query = (f"SELECT r.day, {selected} FROM stock_rows r "
+                     f"JOIN issuers i ON i.issuer_id = r.issuer_id WHERE i.issuer_code = ?")
+            params = [issuer_code]
+            if start_date is not None:
+                query += " AND r.day >= ?"
+                params.append(StockColumns.to_day(pd.Timestamp(start_date).date()))
+            if end_date is not None:
+                query += " AND r.day <= ?"
+                params.append(StockColumns.to_day(pd.Timestamp(end_date).date()))
+            query += " ORDER BY r.day"
+        else:
+            selected = ", ".join(f'"{col}"' for col in NUMERIC_COLUMNS)
+            query = f'SELECT "Date", {selected} FROM stock_data WHERE issuer_code = ?'
+            params = [issuer_code]
+            if start_date is not None:
+                query += ' AND "Date" >= ?'
+                params.append(pd.Timestamp(start_date).strftime("%Y-%m-%d"))
+            if end_date is not None:
+                query += ' AND "Date" <= ?'
+                params.append(pd.Timestamp(end_date).strftime("%Y-%m-%d"))
+            query += ' ORDER BY "Date"'
+
+        rows = (conn or self.conn).execute(query, params).fetchall()
+        frame = pd.DataFrame.from_records(rows, columns=['Date'] + NUMERIC_COLUMNS)
+        if self.compact:
+            frame['Date'] = np.array(frame['Date'], dtype='int64').astype('datetime64[D]').astype('datetime64[ns]')
+        else:
+            frame['Date'] = pd.to_datetime(frame['Date'], format='ISO8601')
+        for col in NUMERIC_COLUMNS:
+            frame[col] = frame[col].astype('float64')
+        return frame
+
+    def date_rows_before(self, conn: sqlite3.Connection, issuer_code: str, before: date,
+                         rows_back: int) -> Optional[date]:
+        """Date of the rows_back-th stored row before the given date, or None when there are fewer rows."""
+        if self.compact:
+            row = conn.execute(
+                "SELECT r.day FROM stock_rows r JOIN issuers i ON i.issuer_id = r.issuer_id "
+                "WHERE i.issuer_code = ? AND r.day < ? ORDER BY r.day DESC LIMIT 1 OFFSET ?",
+                (issuer_code, StockColumns.to_day(before), rows_back - 1)).fetchone()
+            return StockColumns.from_day(row[0]) if row else None
+        row = conn.execute(
+            'SELECT "Date" FROM stock_data WHERE issuer_code = ? AND "Date" < ? ORDER BY "Date" DESC LIMIT 1 OFFSET ?',
+            (issuer_code, before.isoformat(), rows_back - 1)).fetchone()
+        return pd.Timestamp(row[0]).date() if row else None
 
-        # List of columns to format
-        columns_to_format = [
-            'Last Trade Price', 'Max', 'Min', 'Volume', 'Turnover in BEST (denars)'
-        ]
+    def issuer_frame(self, issuer_code: str) -> pd.DataFrame:
+        """The whole history of an issuer, from the frame cache when it is there. Do not modify the result."""
+        # Any write, also by another process, bumps the version; then no cached frame can be trusted
+        self.frame_cache.check_version(self.ingest_version())
+        frame = self.frame_cache.get(issuer_code)
+        if frame is None:
+            generation = self.frame_cache.generation
+            frame = self.load_issuer_frame(issuer_code)
+            self.frame_cache.put(issuer_code, frame, generation)
+        return frame
+
+    def query(self, issuer_code: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+              columns: Optional[List[str]] = None, ascending: bool = True, limit: Optional[int] = None,
+              use_cache: bool = True) -> pd.DataFrame:
+        """Rows of one issuer between two dates (both inclusive, either may be open).
+
+        Returns Date (datetime64) followed by the requested numeric columns (all by default), in date
+        order or newest first. With use_cache the issuer's cached history is sliced with a binary
+        search; otherwise the date bounds go into the range scan.
+        """
+        columns = [col for col in (columns or NUMERIC_COLUMNS) if col != 'Date']
+        unknown = [col for col in columns if col not in NUMERIC_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+        if use_cache:
+            frame = self.issuer_frame(issuer_code)
+        else:
+            frame = self.load_issuer_frame(issuer_code, start_date, end_date)
+        dates = frame['Date'].to_numpy()
+        lower = 0 if start_date is None else np.searchsorted(dates, pd.Timestamp(start_date).to_datetime64(), 'left')
+        upper = len(dates) if end_date is None else np.searchsorted(dates, pd.Timestamp(end_date).to_datetime64(),
+                                                                    'right')
+        result = frame.iloc[lower:upper]
+        if not ascending:
+            result = result.iloc[::-1]
+        if limit is not None:
+            result = result.iloc[:limit]
+        return result[['Date'] + columns].reset_index(drop=True)
+
+    def fetch_sample_data(self, issuer_code: Optional[str] = None, limit: int = 100,
+                          start_date: Optional[date] = None, end_date: Optional[date] = None,
+                          ascending: bool = True):
+        """Fetch a sample of data from the stock_data table, optionally filtered by issuer code and dates."""
+        if issuer_code:
+            df = self.query(issuer_code, start_date, end_date, ascending=ascending, limit=limit)
+            df['Date'] = df['Date'].dt.strftime("%Y-%m-%d")
+            df.insert(0, 'issuer_code', issuer_code)
+        else:
+            query = "SELECT * FROM stock_data WHERE Volume > 0 LIMIT ?"
+            df = pd.read_sql_query(query, self.conn, params=(limit,))
 
         pd.set_option('display.width', 1000)
         pd.set_option('display.colheader_justify', 'center')
@@ -128,8 +757,7 @@ class DatabaseManager:
         pd.set_option('display.max_rows', None)
 
         # Format the numeric columns with commas and two decimal places
-        for col in columns_to_format:
-            df[col] = df[col].apply(lambda x: f"{x:,.2f}" if pd.notnull(x) else x)
+        for col in NUMERIC_COLUMNS:
+            df[col] = format_numbers(df[col])
 
         return df
-
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from queue import Queue, Empty, Full
+from datetime import date
+from typing import List, Optional, Tuple
+import DatabaseManager
+import Metrics
+import StockRows
+
+
+class DatabaseWriter:
+    """Single background thread that batches scraped rows from many issuers into large upsert transactions."""
+
+    def __init__(self, db_manager: DatabaseManager, max_queue_size: int = 64, batch_rows: int = 20000,
+                 flush_interval: float = 1.0, metrics: Optional[Metrics.Metrics] = None):
+        self.db_manager = db_manager
+        # Bounded queue: producers wait when the writer falls behind instead of piling frames up in memory
+        self.queue = Queue(maxsize=max_queue_size)
+        self.batch_rows = batch_rows  # Flush when this many rows are buffered
+        self.flush_interval = flush_interval  # ... or when this many seconds passed since the last flush
+        self.metrics = metrics
+        self.thread = None
+        self.analytics_dirty = False  # Rows were written whose derived-table tails are still pending
+        self.errors = []
+        self.error_lock = threading.Lock()
+        # Throughput statistics
+        self.rows_written = 0
+        self.transactions = 0
+        self.write_time = 0.0
+        self.started_at = None
+        self.stopped_at = None
+
+    def start(self):
+        """Start the writer thread."""
+        self.started_at = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name="DatabaseWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, rows: Optional[StockRows.StockRows], issuer_code: str,
+               window: Optional[Tuple[date, date]] = None):
+        """Queue scraped rows for writing, blocking while the queue is full.
+
+        When the fetched window is given it is journaled in the same transaction as its rows; pass the
+        rows even when they are empty (or None when the page had no table), which the journal records.
+        """
+        self.queue.put((issuer_code, rows, window))
+
+    async def submit_async(self, rows: Optional[StockRows.StockRows], issuer_code: str,
+                           window: Optional[Tuple[date, date]] = None):
+        """Queue rows from the event loop without blocking other coroutines while the queue is full."""
+        try:
+            self.queue.put_nowait((issuer_code, rows, window))
+        except Full:
+            await asyncio.to_thread(self.queue.put, (issuer_code, rows, window))
+
+    async def submit_batch_async(self, rows: StockRows.StockRows, journal_entries: List[tuple]):
+        """Queue rows of many issuers (with their own issuer codes) with the journal entries of their
+        windows; both are committed together in one transaction, right away."""
+        batch = {'rows': rows, 'journal': journal_entries}
+        try:
+            self.queue.put_nowait(batch)
+        except Full:
+            await asyncio.to_thread(self.queue.put, batch)
+
+    def stop(self):
+        """Flush everything still queued and wait for the writer thread to finish."""
+        if self.thread is None:
+            return
+        self.queue.put(None)  # Sentinel: no more work
+        self.thread.join()
+        self.thread = None
+        self.stopped_at = time.perf_counter()
+
+    def _run(self):
+        conn = self.db_manager.connect()  # The writer owns its own connection
+        buffer: List[tuple] = []
+        journal: List[tuple] = []
+        last_flush = time.perf_counter()
+        try:
+            while True:
+                timeout = max(0.0, self.flush_interval - (time.perf_counter() - last_flush))
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except Empty:
+                    item = False  # Timed out: only check the time threshold
+
+                if item is None:
+                    break
+
+                # A dict is a batch of many issuers (e.g. one market-wide day) that is flushed right away
+                batch = isinstance(item, dict)
+                if batch:
+                    try:
+                        if not item['rows'].empty:
+                            start = time.perf_counter()
+                            buffer.extend(self.db_manager.row_tuples(item['rows']))
+                            if self.metrics is not None:
+                                self.metrics.observe('row_tuples', time.perf_counter() - start)
+                        journal.extend(item['journal'])
+                    except Exception as e:
+                        self._add_error(f"Error saving a batch of {len(item['journal'])} windows: {str(e)}")
+                elif item:
+                    issuer_code, rows, window = item
+                    try:
+                        if rows is not None and not rows.empty:
+                            start = time.perf_counter()
+                            buffer.extend(self.db_manager.row_tuples(rows, issuer_code))
+                            if self.metrics is not None:
+                                self.metrics.observe('row_tuples', time.perf_counter() - start, issuer_code)
+                        if window is not None:
+                            journal.append(self.db_manager.journal_entry(issuer_code, *window, rows))
+                    except Exception as e:
+                        self._add_error(f"Error saving data for {issuer_code}: {str(e)}")
+
+                pending = len(buffer) + len(journal)
+                if pending and (batch or len(buffer) >= self.batch_rows
+                                or time.perf_counter() - last_flush >= self.flush_interval):
+                    self._flush(conn, buffer, journal)
+                    buffer = []
+                    journal = []
+                    last_flush = time.perf_counter()
+                elif not pending:
+                    last_flush = time.perf_counter()
+                    if item is False and self.analytics_dirty:
+                        # Idle: catch the derived tables up while no rows are waiting
+                        self._apply_analytics(conn)
+
+            if buffer or journal:
+                self._flush(conn, buffer, journal)
+            if self.analytics_dirty:
+                self._apply_analytics(conn)
+        finally:
+            conn.close()
+
+    def _flush(self, conn, rows: List[tuple], journal: List[tuple]):
+        start = time.perf_counter()
+        try:
+            # Rows and the journal entries of their windows commit together, so a crash never
+            # marks a window as done without its data
+            with conn:
+                self.db_manager.upsert_rows(conn, rows)
+                self.db_manager.update_analytics(conn, rows)
+                if rows:
+                    self.db_manager.bump_ingest_version(conn)
+                self.db_manager.record_windows(conn, journal)
+            # Cached query frames of the issuers just written are stale now
+            if rows:
+                self.db_manager.frame_cache.invalidate({row[0] for row in rows})
+            self.analytics_dirty = self.analytics_dirty or bool(rows)
+            self.rows_written += len(rows)
+            self.transactions += 1
+            if self.metrics is not None:
+                self.metrics.increment('rows_written', len(rows))
+        except Exception as e:
+            self._add_error(f"Error writing {len(rows)} rows: {str(e)}")
+        finally:
+            elapsed = time.perf_counter() - start
+            self.write_time += elapsed
+            if self.metrics is not None:
+                self.metrics.observe('db_write', elapsed)
+
+    def _apply_analytics(self, conn):
+        start = time.perf_counter()
+        self.db_manager.apply_analytics(conn)
+        self.analytics_dirty = False
+        if self.metrics is not None:
+            self.metrics.observe('analytics', time.perf_counter() - start)
+
+    def _add_error(self, message: str):
+        with self.error_lock:
+            self.errors.append(message)
+
+    def report(self) -> str:
+        """Summarize write throughput."""
+        end = self.stopped_at or time.perf_counter()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        rows_per_sec = self.rows_written / self.write_time if self.write_time else 0.0
+        return (f"Wrote {self.rows_written} rows in {self.transactions} transactions "
+                f"({self.write_time:.2f}s writing, {rows_per_sec:,.0f} rows/s, {elapsed:.2f}s total)")
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+import pandas as pd
+
+
+class FrameCache:
+    """In-process LRU cache of whole per-issuer history frames for repeated queries.
+
+    Writers invalidate the issuers they touched. A frame loaded while a write was committing is
+    not stored (the generation changed meanwhile), so a stale frame never enters the cache. Writes
+    from other connections or processes are caught by check_version with the database's ingest version.
+    """
+
+    def __init__(self, max_issuers: int = 64):
+        self.max_issuers = max_issuers
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()  # The database writer invalidates from its own thread
+        self.generation = 0  # Bumped by every invalidation
+        self.version = None  # ingest_state version the cached frames were loaded at
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, issuer_code: str) -> Optional[pd.DataFrame]:
+        with self.lock:
+            frame = self.frames.get(issuer_code)
+            if frame is None:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(issuer_code)
+            self.hits += 1
+            return frame
+
+    def put(self, issuer_code: str, frame: pd.DataFrame, generation: int):
+        """Store a frame loaded when the cache was at the given generation."""
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.frames[issuer_code] = frame
+            self.frames.move_to_end(issuer_code)
+            while len(self.frames) > self.max_issuers:
+                self.frames.popitem(last=False)
+
+    def check_version(self, version: int):
+        """Drop every frame when the database's ingest version moved since the frames were loaded."""
+        with self.lock:
+            if version == self.version:
+                return
+            self.version = version
+        self.invalidate()
+
+    def invalidate(self, issuer_codes: Optional[Iterable[str]] = None):
+        """Drop the frames of the given issuers, or every frame."""
+        with self.lock:
+            self.generation += 1
+            if issuer_codes is None:
+                self.invalidations += len(self.frames)
+                self.frames.clear()
+                return
+            for issuer_code in issuer_codes:
+                if self.frames.pop(issuer_code, None) is not None:
+                    self.invalidations += 1
+
+    def report(self) -> str:
+        with self.lock:
+            requests = self.hits + self.misses
+            hit_rate = self.hits / requests * 100 if requests else 0.0
+            return (f"Frame cache: {len(self.frames)} issuers, {self.hits} hits / {self.misses} misses "
+                    f"({hit_rate:.0f}% hit rate), {self.invalidations} invalidated")
@@ -1,25 +1,44 @@
 from bs4 import BeautifulSoup
-from typing import List
+from typing import List, Optional, Dict
+import asyncio
+import json
+import os
+import time
+import aiohttp
 import requests
 
 
 class IssuerCodeExtractor:
-    def __init__(self):
-        self.url = "https://www.mse.mk/en/stats/symbolhistory/ADIN"
-
+    def __init__(self, cache_path: str = 'issuer_codes.json', cache_ttl: float = 24 * 60 * 60,
+                 base_url: str = "https://www.mse.mk"):
         self.urls = [
-            "https://www.mse.mk/en/issuers/JSC-with-special-reporting-obligations",
-            "https://www.mse.mk/en/issuers/free-market"
+            f"{base_url}/en/issuers/JSC-with-special-reporting-obligations",
+            f"{base_url}/en/issuers/free-market"
         ]
 
-    def get_issuer_codes_from_dropdown(self) -> List[str]:
-        response = requests.get(self.url)
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Issuer lists change rarely, so they are kept on disk and revalidated after cache_ttl seconds
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        # Whether the codes last returned by get_issuer_codes_async come from a refresh in which every
+        # listing page was fetched; only then may issuers missing from them be taken as unlisted
+        self.listing_complete = False
+
+    def parse_listing(self, content) -> List[str]:
+        codes = []
+        soup = BeautifulSoup(content, 'html.parser')
 
-        dropdown = soup.find('select', {'id': 'Code'})
-        options = dropdown.find_all('option')
-        codes = [option['value'] for option in options if option['value']]
+        table = soup.find('table', {'id': 'otherlisting-table'})
+        if table:
+            # skip header row if it exists
+            rows = table.find_all('tr')
 
+            # Extract the symbol (first column) from each row
+            for row in rows:
+                columns = row.find_all('td')
+                if columns:  # Make sure row has columns
+                    symbol = columns[0].get_text(strip=True)
+                    if symbol:  # Only add non-empty symbols
+                        codes.append(symbol)
         return codes
 
     def get_issuer_codes(self) -> List[str]:
@@ -29,20 +48,7 @@ class IssuerCodeExtractor:
             try:
                 response = requests.get(url)
                 response.raise_for_status()  # Raise an exception for bad status codes
-                soup = BeautifulSoup(response.content, 'html.parser')
-
-                table = soup.find('table', {'id': 'otherlisting-table'})
-                if table:
-                    # skip header row if it exists
-                    rows = table.find_all('tr')
-
-                    # Extract the symbol (first column) from each row
-                    for row in rows:
-                        columns = row.find_all('td')
-                        if columns:  # Make sure row has columns
-                            symbol = columns[0].get_text(strip=True)
-                            if symbol:  # Only add non-empty symbols
-                                all_codes.append(symbol)
+                all_codes.extend(self.parse_listing(response.content))
 
             except requests.RequestException as e:
                 print(f"Error fetching data from {url}: {e}")
@@ -51,6 +57,110 @@ class IssuerCodeExtractor:
         unique_codes = list(dict.fromkeys(all_codes))
         return unique_codes
 
+    def load_cache(self) -> Optional[Dict]:
+        """Read the issuer cache from disk, or None if there is no usable cache."""
+        if not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable issuer cache {self.cache_path}: {e}")
+            return None
+
+    def save_cache(self, cache: Dict):
+        """Write the issuer cache atomically so a crash never leaves a truncated file."""
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def codes_from_cache(self, cache: Dict) -> List[str]:
+        all_codes = []
+        for url in self.urls:
+            all_codes.extend(cache.get('sources', {}).get(url, {}).get('codes', []))
+        return list(dict.fromkeys(all_codes))
+
+    def get_cached_codes(self, allow_stale: bool = False) -> Optional[List[str]]:
+        """Return the cached issuer codes without any network I/O, or None if the cache is missing or expired."""
+        cache = self.load_cache()
+        if not cache:
+            return None
+        if not allow_stale and time.time() - cache.get('fetched_at', 0) > self.cache_ttl:
+            return None
+        codes = self.codes_from_cache(cache)
+        return codes or None
+
+    async def fetch_source(self, session: aiohttp.ClientSession, url: str, cached: Dict, parser) -> Dict:
+        """Fetch one source page, sending the cached validators so an unchanged page costs a 304."""
+        headers = {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304 and 'codes' in cached:
+                    return cached
+                response.raise_for_status()
+                content = await response.read()
+                return {
+                    'codes': parser(content),
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error fetching data from {url}: {e}")
+            return dict(cached, failed=True)  # Keep the previous result for this source
+
+    async def refresh_cache(self, session: Optional[aiohttp.ClientSession] = None) -> Dict:
+        """Fetch the listing pages concurrently and store the result on disk.
+
+        The issuer list comes from the listing pages alone.
+        """
+        cache = self.load_cache() or {}
+        sources = cache.get('sources', {})
+        targets = [(url, self.parse_listing) for url in self.urls]
+
+        async def fetch_all(active_session):
+            return await asyncio.gather(*[
+                self.fetch_source(active_session, url, sources.get(url, {}), parser) for url, parser in targets
+            ])
+
+        if session is not None:
+            results = await fetch_all(session)
+        else:
+            async with aiohttp.ClientSession() as own_session:
+                results = await fetch_all(own_session)
+
+        # A partial refresh keeps the old timestamp so the failed sources are retried on the next run
+        complete = not any([result.pop('failed', False) for result in results])
+        self.listing_complete = complete
+        cache = {
+            'fetched_at': time.time() if complete else cache.get('fetched_at', 0),
+            'sources': {url: result for (url, _), result in zip(targets, results)}
+        }
+        try:
+            self.save_cache(cache)
+        except OSError as e:
+            print(f"Could not write issuer cache {self.cache_path}: {e}")
+        return cache
+
+    async def get_issuer_codes_async(self, session: Optional[aiohttp.ClientSession] = None,
+                                     refresh: bool = False) -> List[str]:
+        """Get issuer codes from the local cache, revalidating against the site only once the TTL expired."""
+        if not refresh:
+            codes = self.get_cached_codes()
+            if codes:
+                # A fresh cache was written by a refresh without failed sources
+                self.listing_complete = True
+                return codes
+        cache = await self.refresh_cache(session)
+        codes = self.codes_from_cache(cache)
+        self.listing_complete = self.listing_complete and bool(codes)
+        return codes
+
     def filter_codes(self, codes: List[str]) -> List[str]:
         return [code for code in codes if
                 not any(char.isdigit() for char in code)]
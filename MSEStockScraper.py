@@ -1,134 +1,244 @@
-from datetime import timedelta
+import asyncio
+import random
+from concurrent.futures import Executor
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Union
 
 import aiohttp
-import pandas as pd
-from bs4 import BeautifulSoup
-import warnings
+import ConcurrencyController
+import Metrics
+import ResultsTableParser
+import StockRows
+import WindowCache
 
 # no_table_codes = []
 
-warnings.filterwarnings("ignore", category=FutureWarning, message="Passing literal html to 'read_html' is deprecated")
+BASE_URL = "https://www.mse.mk"
 
+# Statuses that mean "try again later" rather than "this page does not exist"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-def clean_numeric(value):
-    """Clean numeric values, handling both string and numeric inputs"""
-    if pd.isna(value):
+
+class FetchError(Exception):
+    """A symbolhistory page could not be fetched, even after retrying."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
         return None
-    if isinstance(value, (int, float)):
-        return float(value)
-    if isinstance(value, str):
-        return float(value.replace(',', '').replace(' ', ''))
-    return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def create_session(connection_limit: int = 100, limit_per_host: int = 30,
+                   dns_cache_ttl: int = 300, keepalive_timeout: float = 30.0,
+                   request_timeout: float = 60.0) -> aiohttp.ClientSession:
+    """Create a pooled HTTP session that is shared by all scrapers for the duration of a run."""
+    connector = aiohttp.TCPConnector(
+        limit=connection_limit,  # Total open connections in the pool
+        limit_per_host=limit_per_host,  # Cap on connections to the exchange site
+        ttl_dns_cache=dns_cache_ttl,  # Resolve mse.mk once instead of on every request
+        use_dns_cache=True,
+        keepalive_timeout=keepalive_timeout  # Keep idle connections open for reuse
+    )
+    # Bounded request time, so a stalled response becomes a retry instead of hanging a worker
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=request_timeout))
 
 
 class MSEStockScraper:
-    def __init__(self, issuer_code):
-        self.url = f"https://www.mse.mk/en/stats/symbolhistory/{issuer_code}"
+    def __init__(self, issuer_code, session: Optional[aiohttp.ClientSession] = None,
+                 limiter: Optional[Union[asyncio.Semaphore, ConcurrencyController.ConcurrencyController]] = None,
+                 cache: Optional[WindowCache.WindowCache] = None, max_retries: int = 4,
+                 backoff_base: float = 0.5, backoff_cap: float = 30.0, base_url: str = BASE_URL,
+                 metrics: Optional[Metrics.Metrics] = None, verbose: bool = True,
+                 parse_executor: Optional[Executor] = None, max_retry_after: float = 60.0):
+        self.url = f"{base_url}/en/stats/symbolhistory/{issuer_code}"
         self.symbol = issuer_code
-        self.data = []
-        # Column names in order as they appear
-        self.column_names = [
-            "Date",
-            "Last Trade Price",
-            "Max",
-            "Min",
-            "Avg. Price",
-            "%chg.",
-            "Volume",
-            "Turnover in BEST (denars)",
-            "Total turnover (denars)"
-        ]
-        self.columns_to_keep = [
-            "Date",
-            "Last Trade Price",
-            "Max",
-            "Min",
-            "Volume",
-            "Turnover in BEST (denars)"
-        ]
-
-    async def scrape_table(self, start_date, end_date):
-        """Scrape the data table for the entire date range and return as a DataFrame."""
-        try:
-            # Convert start_date and end_date to strings in "YYYY-MM-DD" format
-            params = {
-                "FromDate": start_date.strftime("%Y-%m-%d"),
-                "ToDate": end_date.strftime("%Y-%m-%d")
-            }
-            all_data = []
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.url, params=params) as response:
-                    # print(f"Response Status: {response.status}")
-                    html = await response.text()
-                    soup = BeautifulSoup(html, "html.parser")
-
-                    table = soup.find("table", id="resultsTable")
-                    if table:
-                        # Read table without headers
-                        df = pd.read_html(str(table), header=None)[0]
-                        df.columns = self.column_names
-
-                        # Keep only the desired columns
-                        df = df[self.columns_to_keep]
-
-                        # Convert numeric columns
-                        numeric_columns = ['Last Trade Price', 'Max', 'Min', 'Volume', 'Turnover in BEST (denars)']
-                        for col in numeric_columns:
-                            if col in df.columns:
-                                df[col] = df[col].apply(clean_numeric)
-
-                        # Convert date column to datetime
-                        df['Date'] = pd.to_datetime(df['Date']).dt.date
-
-                        all_data.append(df)
-                    else:
-                        print(f"No table found for {self.symbol}")
-                        # no_table_codes.append(self.symbol)
-
-            if all_data:
-                final_data = pd.concat(all_data, ignore_index=True)
-                final_data = final_data.drop_duplicates()
-                return final_data
+        # Shared session owned by the caller; when missing a session is opened per request
+        self.session = session
+        # Global budget of in-flight requests shared by all scrapers in a run
+        self.limiter = limiter
+        # On-disk cache of pages for closed windows
+        self.cache = cache
+        # Retries with jittered exponential backoff for failed requests
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # Upper bound on a server's Retry-After, which also pauses every other request of the run
+        self.max_retry_after = max_retry_after
+        # Stage timings and counters; verbose=False drops the per-window prints
+        self.metrics = metrics
+        self.verbose = verbose
+        # Process pool that parses pages off the event loop's process; None parses in the calling thread
+        self.parse_executor = parse_executor
+
+    async def fetch_html(self, params):
+        """Fetch the raw symbolhistory page, serving closed windows from the cache when one was provided.
+
+        Cache reads and writes (gzip, file replacement, eviction) run in a thread, off the event loop.
+        """
+        cached = None
+        headers = {}
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, self.symbol, params["FromDate"], params["ToDate"])
+            if cached is not None:
+                if cached['closed']:
+                    if self.metrics is not None:
+                        self.metrics.increment('cache_hits', issuer_code=self.symbol)
+                    return cached['html']
+                # Open window: ask the server whether the cached page is still current
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+
+        status, html, response_headers = await self.fetch_with_retries(params, headers)
+
+        if self.cache is not None:
+            if status == 304 and cached is not None:
+                self.cache.record_revalidated()
+                return cached['html']
+            if cached is not None:
+                self.cache.record_miss()
+            # An error page served with 200 must not be replayed as the window's content
+            if status == 200 and ResultsTableParser.has_results_table(html):
+                await asyncio.to_thread(self.cache.put, self.symbol, params["FromDate"], params["ToDate"], html,
+                                        etag=response_headers.get('ETag'),
+                                        last_modified=response_headers.get('Last-Modified'))
+        return html
+
+    async def fetch_with_retries(self, params, headers):
+        """Send the request, retrying connection errors and overload responses with jittered backoff."""
+        controller = self.limiter if isinstance(self.limiter, ConcurrencyController.ConcurrencyController) else None
+        attempt = 0
+        while True:
+            retry_after = None
+            error = None
+            started = None
+            try:
+                if self.limiter is not None:
+                    async with self.limiter:
+                        # Measure only the request itself, not the wait for a free slot
+                        started = time.monotonic()
+                        status, html, response_headers = await self._get(params, headers)
+                else:
+                    started = time.monotonic()
+                    status, html, response_headers = await self._get(params, headers)
+                if self.metrics is not None:
+                    self.metrics.observe('http_fetch', time.monotonic() - started, self.symbol)
+                ok = status not in RETRY_STATUSES
+                if not ok:
+                    error = f"HTTP {status}"
+                    retry_after = parse_retry_after(response_headers.get('Retry-After'))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                ok = False
+                error = str(e) or type(e).__name__
+
+            if controller is not None and started is not None:
+                controller.record(time.monotonic() - started, ok)
+            if self.metrics is not None:
+                self.metrics.increment('http_requests', issuer_code=self.symbol)
+                if not ok:
+                    self.metrics.increment('http_errors', issuer_code=self.symbol)
+            if ok:
+                return status, html, response_headers
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise FetchError(f"{self.symbol} {params['FromDate']}..{params['ToDate']}: {error} "
+                                 f"after {self.max_retries} retries")
+
+            if retry_after is not None:
+                # The server told us how long to back off; hold back every other request too, but
+                # never for longer than max_retry_after (a bogus header must not stall the whole run)
+                delay = min(retry_after, self.max_retry_after)
+                if controller is not None:
+                    controller.pause(delay)
             else:
+                # Full jitter keeps retries from many workers from arriving in lockstep
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            await asyncio.sleep(delay)
+
+    async def _get(self, params, headers):
+        if self.session is not None:
+            async with self.session.get(self.url, params=params, headers=headers) as response:
+                # print(f"Response Status: {response.status}")
+                return response.status, await response.text(), response.headers
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get(self.url, params=params, headers=headers) as response:
+                return response.status, await response.text(), response.headers
+
+    async def fetch_window(self, start_date, end_date) -> str:
+        """Fetch the raw page of one date range."""
+        # Convert start_date and end_date to strings in "YYYY-MM-DD" format
+        params = {
+            "FromDate": start_date.strftime("%Y-%m-%d"),
+            "ToDate": end_date.strftime("%Y-%m-%d")
+        }
+        return await self.fetch_html(params)
+
+    def parse_html(self, html: str) -> Optional[StockRows.StockRows]:
+        """Parse a fetched page into typed rows, or None when it has no results table.
+
+        A page that cannot be parsed raises: the window must fail (and be retried by the next run)
+        rather than be journaled as fetched.
+        """
+        # Single pass over the page: cells go straight into columns, then get converted per column
+        start = time.perf_counter()
+        columns = ResultsTableParser.parse_results_table(html)
+        parsed = time.perf_counter()
+        if self.metrics is not None:
+            self.metrics.observe('parse', parsed - start, self.symbol)
+        if columns is None:
+            if self.verbose:
+                print(f"No table found for {self.symbol}")
                 print(f"No data retrieved for {self.symbol}")
-                return None
-
-        except Exception as e:
-            print(f"Error scraping table: {self.symbol} - {str(e)}")
+                # no_table_codes.append(self.symbol)
             return None
 
-    async def scrape_historical_data(self, start_date, end_date):
-        """Scrape data for the specified date range in yearly increments."""
-        try:
-            print(f"Scraping data for code: {self.symbol}")
-            all_data = []  # To store the combined data from each yearly scrape
-
-            current_start = start_date
-            while current_start < end_date:
-                # Calculate the end of the current one-year period
-                current_end = min(current_start + timedelta(days=365), end_date)
-
-                # Scrape data for the current year range
-                data = await self.scrape_table(current_start, current_end)
-                if data is not None and not data.empty:
-                    all_data.append(data)
-                    print(f"Scraped {len(data)} rows from {current_start} to {current_end} for {self.symbol}")
-                else:
-                    print(f"No data found from {current_start} to {current_end}")
-
-                # Move to the next year
-                current_start = current_end + timedelta(days=1)
-
-            # Combine all data into a single DataFrame if any data was found
-            if all_data:
-                final_data = pd.concat(all_data, ignore_index=True)
-                print(f"Successfully scraped {len(final_data)} rows in total for code: {self.symbol}")
-                return final_data
-            else:
-                print(f"Scraping data for code: {self.symbol} error: NO DATA")
-                return None
-
-        except Exception as e:
-            print(f"Error scraping historical data for code: {self.symbol} - {str(e)}")
-            return None
+        rows = ResultsTableParser.to_rows(columns)
+        if self.metrics is not None:
+            self.metrics.observe('clean', time.perf_counter() - parsed, self.symbol)
+        self.report_dropped(rows)
+        return rows
+
+    def report_dropped(self, rows: Optional[StockRows.StockRows]):
+        """Count rows lost to an unparsable date; their window is journaled as partial and fetched again."""
+        if rows is None or not rows.dropped:
+            return
+        if self.metrics is not None:
+            self.metrics.increment('rows_dropped', rows.dropped, issuer_code=self.symbol)
+        print(f"Dropped {rows.dropped} rows with an unparsable date for {self.symbol}")
+
+    async def parse_window(self, html: str) -> Optional[StockRows.StockRows]:
+        """Parse a fetched page in the worker pool when one is set, otherwise in the calling thread.
+
+        Errors propagate like those of parse_html; a dead worker pool fails the window the same way.
+        """
+        if self.parse_executor is None:
+            return self.parse_html(html)
+        # The worker parses and converts the page; only the typed rows' arrays are pickled back
+        start = time.perf_counter()
+        rows = await asyncio.get_running_loop().run_in_executor(
+            self.parse_executor, ResultsTableParser.parse_to_rows, html)
+        if self.metrics is not None:
+            self.metrics.observe('parse', time.perf_counter() - start, self.symbol)
+
+        if rows is None and self.verbose:
+            print(f"No table found for {self.symbol}")
+            print(f"No data retrieved for {self.symbol}")
+        self.report_dropped(rows)
+        return rows
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from datetime import date, timedelta
+from typing import List
+import aiohttp
+import MSEStockScraper
+import ResultsTableParser
+import StockRows
+
+# Pseudo issuer code under which market-wide pages are cached, journaled in errors and counted in metrics
+MARKET_CODE = '_market'
+
+
+def trading_days(start_date: date, end_date: date) -> List[date]:
+    """Weekdays from start_date to end_date (both inclusive); the exchange does not trade on weekends."""
+    days = []
+    current = start_date
+    while current <= end_date:
+        if current.weekday() < 5:
+            days.append(current)
+        current += timedelta(days=1)
+    return days
+
+
+class MarketDayScraper(MSEStockScraper.MSEStockScraper):
+    """Fetches the market-wide daily results page: one request returns the trades of every issuer on a day.
+
+    url_template is the page's address with a {date} (YYYY-MM-DD) and optionally a {base_url} placeholder.
+    Retries, the shared limiter, the window cache and metrics work as for symbolhistory pages.
+    """
+
+    def __init__(self, url_template: str, base_url: str = MSEStockScraper.BASE_URL, **kwargs):
+        super().__init__(MARKET_CODE, base_url=base_url, **kwargs)
+        self.url_template = url_template
+        self.base_url = base_url
+
+    async def _get(self, params, headers):
+        # The day goes into the URL itself; FromDate/ToDate only key the cache and the error messages
+        url = self.url_template.format(base_url=self.base_url, date=params["FromDate"])
+        if self.session is not None:
+            async with self.session.get(url, headers=headers) as response:
+                return response.status, await response.text(), response.headers
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, headers=headers) as response:
+                return response.status, await response.text(), response.headers
+
+    async def scrape_day(self, day: date) -> StockRows.StockRows:
+        """Fetch and parse one day's page into typed rows with their issuer codes (one row per trade).
+
+        A page without the results table raises FetchError: it says nothing about the issuers, so the
+        day must not be journaled as fetched.
+        """
+        html = await self.fetch_window(day, day)
+        start = time.perf_counter()
+        if self.parse_executor is not None:
+            rows = await asyncio.get_running_loop().run_in_executor(
+                self.parse_executor, ResultsTableParser.parse_market_day, html, day)
+        else:
+            rows = await asyncio.to_thread(ResultsTableParser.parse_market_day, html, day)
+        if self.metrics is not None:
+            self.metrics.observe('parse', time.perf_counter() - start, self.symbol)
+        if rows is None:
+            raise MSEStockScraper.FetchError(f"No results table on the market page of {day}")
+        return rows
@@ -0,0 +1,152 @@
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+
+class _Timing:
+    """Count, sum, extremes and a bucketed histogram of one timed stage."""
+
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # Last bucket is +Inf
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min or 0.0,
+            'max': self.max,
+            'buckets': {str(bound): count for bound, count in zip(LATENCY_BUCKETS + ['+Inf'], self.buckets)}
+        }
+
+
+class Metrics:
+    """Timers, counters and latency histograms for the pipeline stages, per issuer and aggregated.
+
+    Stages used by the scraper: http_fetch, parse, clean (cells to typed rows), row_tuples (typed rows
+    to the writer's statement parameters), db_write and queue_wait.
+    """
+
+    def __init__(self, progress_interval: float = 5.0):
+        self.lock = threading.Lock()  # The database writer records from its own thread
+        self.timings: Dict[str, _Timing] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.issuers: Dict[str, Dict[str, float]] = {}
+        self.started_at = time.time()
+        # Progress summary printed instead of one line per window
+        self.progress_interval = progress_interval
+        self.last_progress = time.monotonic()
+        self.total_windows = 0
+
+    def observe(self, stage: str, seconds: float, issuer_code: Optional[str] = None):
+        """Record one duration of a stage."""
+        with self.lock:
+            timing = self.timings.get(stage)
+            if timing is None:
+                timing = self.timings[stage] = _Timing()
+            timing.add(seconds)
+            if issuer_code is not None:
+                per_issuer = self.issuers.setdefault(issuer_code, {})
+                per_issuer[f"{stage}_seconds"] = per_issuer.get(f"{stage}_seconds", 0.0) + seconds
+                per_issuer[f"{stage}_count"] = per_issuer.get(f"{stage}_count", 0) + 1
+
+    def increment(self, name: str, value: float = 1, issuer_code: Optional[str] = None):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if issuer_code is not None:
+                per_issuer = self.issuers.setdefault(issuer_code, {})
+                per_issuer[name] = per_issuer.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self.lock:
+            self.gauges[name] = value
+
+    def progress(self, force: bool = False):
+        """Print a one-line summary at most once per progress_interval seconds."""
+        now = time.monotonic()
+        if not force and now - self.last_progress < self.progress_interval:
+            return
+        self.last_progress = now
+        with self.lock:
+            done = self.counters.get('windows_done', 0)
+            rows = self.counters.get('rows_scraped', 0)
+            errors = self.counters.get('errors', 0)
+        elapsed = time.time() - self.started_at
+        total = f"/{self.total_windows}" if self.total_windows else ""
+        print(f"[{elapsed:7.1f}s] windows {done:.0f}{total}, rows {rows:,.0f}, errors {errors:.0f}, "
+              f"{done / elapsed if elapsed else 0.0:.1f} windows/s", flush=True)
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'duration': time.time() - self.started_at,
+                'timings': {stage: timing.to_dict() for stage, timing in self.timings.items()},
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'issuers': {code: dict(values) for code, values in self.issuers.items()}
+            }
+
+    def export_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def export_prometheus(self, path: str):
+        """Write the aggregated metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for stage, timing in sorted(self.timings.items()):
+                name = f"mse_{stage}_seconds"
+                lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, timing.buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{le="+Inf"}} {timing.count}')
+                lines.append(f"{name}_sum {timing.total}")
+                lines.append(f"{name}_count {timing.count}")
+            for counter, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE mse_{counter}_total counter")
+                lines.append(f"mse_{counter}_total {value}")
+            for gauge, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE mse_{gauge} gauge")
+                lines.append(f"mse_{gauge} {value}")
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+    def export(self, directory: str):
+        """Write metrics.json and metrics.prom into the given directory."""
+        os.makedirs(directory, exist_ok=True)
+        self.export_json(os.path.join(directory, 'metrics.json'))
+        self.export_prometheus(os.path.join(directory, 'metrics.prom'))
+
+    def report(self) -> str:
+        """Short per-stage summary for the end of a run."""
+        lines = []
+        with self.lock:
+            for stage, timing in sorted(self.timings.items()):
+                mean = timing.total / timing.count if timing.count else 0.0
+                lines.append(f"{stage:<12} {timing.count:7d} x  mean {mean * 1000:8.1f} ms  "
+                             f"max {timing.max * 1000:8.1f} ms  total {timing.total:8.2f} s")
+        return "\n".join(lines)
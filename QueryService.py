@@ -0,0 +1,239 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+from aiohttp import web
+import StockReader
+
+
+class ReaderPool:
+    """Fixed set of read-only connections; each query borrows one and runs in a worker thread.
+
+    In WAL mode the readers see the last committed state and never block, or get blocked by,
+    the scraper's writer.
+    """
+
+    def __init__(self, db_path: str, size: int = 4):
+        self.readers = asyncio.Queue()
+        for _ in range(size):
+            self.readers.put_nowait(StockReader.StockReader(db_path))
+        self.size = size
+        # The version check is a single-row lookup, cheaper on the event loop than a hop to a thread
+        self.version_reader = StockReader.StockReader(db_path)
+
+    def ingest_version(self) -> int:
+        return self.version_reader.ingest_version()
+
+    async def run(self, func: Callable, *args):
+        reader = await self.readers.get()
+        try:
+            return await asyncio.to_thread(func, reader, *args)
+        finally:
+            self.readers.put_nowait(reader)
+
+    def close(self):
+        while not self.readers.empty():
+            self.readers.get_nowait().close()
+        self.version_reader.close()
+
+
+class ResponseCache:
+    """LRU of rendered responses. Entries carry the ingest version they were read at and are only
+    served while it is still current, so every write of rows invalidates them."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: str, version: int) -> Optional[Tuple[str, bytes, str]]:
+        """(etag, body, content type) of a response built at the given version, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, key: str, version: int, etag: str, body: bytes, content_type: str):
+        with self.lock:
+            self.entries[key] = (version, etag, body, content_type)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                    'not_modified': self.not_modified}
+
+
+def make_etag(key: str, version: int) -> str:
+    return f'"{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"'
+
+
+def render(header: List[str], rows: List[tuple], fmt: str) -> Tuple[bytes, str]:
+    """Rows as a JSON array of objects or as CSV with a header line."""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        writer.writerows(rows)
+        return buffer.getvalue().encode(), 'text/csv'
+    return json.dumps([dict(zip(header, row)) for row in rows]).encode(), 'application/json'
+
+
+def read_rendered(reader: StockReader.StockReader, fmt: str, query: Callable, *args) -> Tuple[int, bytes, str]:
+    """Run a query and render it in the worker thread; the ingest version is read in the same
+    transaction, so it is the version of exactly the rows returned."""
+    reader.conn.execute("BEGIN")
+    try:
+        version = reader.ingest_version()
+        header, rows = query(reader, *args)
+    finally:
+        reader.conn.execute("ROLLBACK")
+    return (version,) + render(header, rows, fmt)
+
+
+def issuers_query(reader: StockReader.StockReader) -> Tuple[List[str], List[tuple]]:
+    return ['issuer_code', 'first_date', 'last_date', 'rows'], reader.issuer_summary()
+
+
+def history_query(reader: StockReader.StockReader, issuer_code: str, start_date: Optional[date],
+                  end_date: Optional[date], columns: Optional[List[str]], ascending: bool,
+                  limit: Optional[int]) -> Tuple[List[str], List[tuple]]:
+    rows = reader.rows(issuer_code, start_date, end_date, columns, ascending, limit)
+    return ['Date'] + (columns or list(StockReader.COLUMNS)), rows
+
+
+def latest_query(reader: StockReader.StockReader,
+                 issuer_codes: Optional[List[str]]) -> Tuple[List[str], List[tuple]]:
+    return ['issuer_code', 'Date'] + list(StockReader.COLUMNS), reader.latest_rows(issuer_codes)
+
+
+def query_date(request: web.Request, name: str) -> Optional[date]:
+    value = request.query.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be a YYYY-MM-DD date")
+
+
+def query_list(request: web.Request, name: str) -> Optional[List[str]]:
+    value = request.query.get(name)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+
+class QueryService:
+    """Read-only HTTP API over the stored data, meant to run next to the scraper:
+
+        GET /issuers                     issuer codes with first/last date and row count
+        GET /history/{code}              rows of an issuer; start, end, columns, order=asc|desc, limit
+        GET /latest                      newest row per issuer; codes=A,B to restrict
+        GET /status                      ingest version, cache and pool counters
+
+    Every data endpoint answers JSON, or CSV with format=csv, and carries an ETag derived from the
+    ingest version, so clients revalidate with If-None-Match and get 304 until new rows are written.
+    """
+
+    def __init__(self, db_path: str = 'mse_stocks.db', connections: int = 4, cache_entries: int = 512):
+        self.db_path = db_path
+        self.connections = connections
+        self.cache = ResponseCache(cache_entries)
+        self.pool = None
+        self.runner = None
+        self.app = web.Application()
+        self.app.router.add_get('/issuers', self.issuers)
+        self.app.router.add_get('/history/{code}', self.history)
+        self.app.router.add_get('/latest', self.latest)
+        self.app.router.add_get('/status', self.status)
+        self.app.on_startup.append(self.open_pool)
+        self.app.on_cleanup.append(self.close_pool)
+
+    async def open_pool(self, app):
+        self.pool = ReaderPool(self.db_path, self.connections)
+
+    async def close_pool(self, app):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    async def respond(self, request: web.Request, query: Callable, *args) -> web.Response:
+        """Serve a query through the ETag check and the response cache."""
+        fmt = request.query.get('format', 'json')
+        if fmt not in ('json', 'csv'):
+            raise web.HTTPBadRequest(text="format must be json or csv")
+        key = request.path_qs
+        version = self.pool.ingest_version()
+        etag = make_etag(key, version)
+        if etag in request.headers.get('If-None-Match', ''):
+            self.cache.not_modified += 1
+            return web.Response(status=304, headers={'ETag': etag})
+
+        cached = self.cache.get(key, version)
+        if cached is None:
+            try:
+                version, body, content_type = await self.pool.run(read_rendered, fmt, query, *args)
+            except ValueError as e:
+                raise web.HTTPBadRequest(text=str(e))
+            etag = make_etag(key, version)
+            self.cache.put(key, version, etag, body, content_type)
+        else:
+            etag, body, content_type = cached
+        # no-cache: clients may keep the response but revalidate it with the ETag before reuse
+        return web.Response(body=body, content_type=content_type,
+                            headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+    async def issuers(self, request: web.Request) -> web.Response:
+        return await self.respond(request, issuers_query)
+
+    async def history(self, request: web.Request) -> web.Response:
+        order = request.query.get('order', 'asc')
+        if order not in ('asc', 'desc'):
+            raise web.HTTPBadRequest(text="order must be asc or desc")
+        limit = request.query.get('limit')
+        if limit is not None and not limit.isdigit():
+            raise web.HTTPBadRequest(text="limit must be a positive integer")
+        return await self.respond(request, history_query, request.match_info['code'], query_date(request, 'start'),
+                                  query_date(request, 'end'), query_list(request, 'columns'), order == 'asc',
+                                  int(limit) if limit is not None else None)
+
+    async def latest(self, request: web.Request) -> web.Response:
+        return await self.respond(request, latest_query, query_list(request, 'codes'))
+
+    async def status(self, request: web.Request) -> web.Response:
+        version = self.pool.ingest_version()
+        return web.json_response({'ingest_version': version, 'connections': self.pool.size,
+                                  'cache': self.cache.stats()})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8000):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def serve_forever(self, host: str = '127.0.0.1', port: int = 8000):
+        await self.start(host, port)
+        print(f"Serving {self.db_path} on http://{host}:{port} with {self.connections} read connections",
+              flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
@@ -0,0 +1,208 @@
+import re
+from datetime import date
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+import StockRows
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # Fall back to the standard library parser when lxml is not installed
+    lxml_etree = None
+
+# Column names in order as they appear in the symbolhistory results table
+COLUMN_NAMES = [
+    "Date",
+    "Last Trade Price",
+    "Max",
+    "Min",
+    "Avg. Price",
+    "%chg.",
+    "Volume",
+    "Turnover in BEST (denars)",
+    "Total turnover (denars)"
+]
+
+COLUMNS_TO_KEEP = [
+    "Date",
+    "Last Trade Price",
+    "Max",
+    "Min",
+    "Volume",
+    "Turnover in BEST (denars)"
+]
+
+NUMERIC_COLUMNS = StockRows.VALUE_COLUMNS
+
+# The market-wide daily results table has the same layout with the issuer code in place of the date
+MARKET_COLUMN_NAMES = ["Issuer code"] + COLUMN_NAMES[1:]
+
+
+class _ResultsTableHTMLParser(HTMLParser):
+    """Streaming fallback parser that collects the cells of #resultsTable in a single pass."""
+
+    def __init__(self, table_id: str):
+        super().__init__()
+        self.table_id = table_id
+        self.found = False
+        self.depth = 0  # Nesting depth of tables inside the results table
+        self.rows = []
+        self.row = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            if self.depth:
+                self.depth += 1
+            elif dict(attrs).get('id') == self.table_id:
+                self.found = True
+                self.depth = 1
+        elif self.depth == 1:
+            if tag == 'tr':
+                self.row = []
+            elif tag == 'td' and self.row is not None:
+                self.cell = []
+
+    def handle_endtag(self, tag):
+        if not self.depth:
+            return
+        if tag == 'table':
+            self.depth -= 1
+        elif self.depth == 1:
+            if tag == 'td' and self.cell is not None:
+                self.row.append(''.join(self.cell).strip())
+                self.cell = None
+            elif tag == 'tr' and self.row is not None:
+                self.rows.append(self.row)
+                self.row = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+
+def _cell_text(td) -> str:
+    # Plain cells only hold text; fall back to the full text for cells with nested markup
+    if len(td):
+        return ''.join(td.itertext()).strip()
+    return (td.text or '').strip()
+
+
+def _rows_with_lxml(html: str, table_id: str) -> Optional[List[List[str]]]:
+    root = lxml_etree.fromstring(html, lxml_etree.HTMLParser())
+    if root is None:
+        return None
+    tables = root.xpath('//table[@id=$table_id]', table_id=table_id)
+    if not tables:
+        return None
+    return [[_cell_text(td) for td in tr.iterchildren('td')] for tr in tables[0].iter('tr')]
+
+
+def _rows_with_stdlib(html: str, table_id: str) -> Optional[List[List[str]]]:
+    parser = _ResultsTableHTMLParser(table_id)
+    parser.feed(html)
+    parser.close()
+    if not parser.found:
+        return None
+    return [row for row in parser.rows if row]
+
+
+def has_results_table(html: str, table_id: str = 'resultsTable') -> bool:
+    """Cheap check, without parsing, whether a page contains the results table (e.g. before caching it)."""
+    pattern = r"<table\b[^>]*\bid\s*=\s*['\"]?" + re.escape(table_id) + r"['\"\s>]"
+    return re.search(pattern, html, re.IGNORECASE) is not None
+
+
+def parse_results_table(html: str, table_id: str = 'resultsTable',
+                        column_names: List[str] = COLUMN_NAMES) -> Optional[Dict[str, List[str]]]:
+    """Extract the cells of the results table straight into columns of raw strings.
+
+    Returns None when the page has no results table.
+    """
+    if not html:
+        return None
+
+    if lxml_etree is not None:
+        rows = _rows_with_lxml(html, table_id)
+    else:
+        rows = _rows_with_stdlib(html, table_id)
+    if rows is None:
+        return None
+
+    # Skip rows that do not match the table layout (e.g. "no data" placeholder rows)
+    rows = [row for row in rows if len(row) == len(column_names)]
+    if not rows:
+        return {name: [] for name in column_names}
+
+    # Transpose rows into columns in one step
+    return {name: list(values) for name, values in zip(column_names, zip(*rows))}
+
+
+def numeric_values(columns: Dict[str, List[str]]) -> np.ndarray:
+    """Convert the raw numeric columns to one float array with a row per column, in NUMERIC_COLUMNS order.
+
+    Thousands separators are stripped; an empty or malformed cell becomes NaN. A plain float() per cell
+    is several times faster than a chain of pandas string operations, also on pages of a full year
+    (benchmarks/bench_conversion.py compares the two).
+    """
+    values = np.empty((len(NUMERIC_COLUMNS), len(columns[NUMERIC_COLUMNS[0]])))
+    for row, name in zip(values, NUMERIC_COLUMNS):
+        for index, cell in enumerate(columns[name]):
+            try:
+                row[index] = float(cell.replace(',', '').replace(' ', ''))
+            except ValueError:
+                row[index] = np.nan
+    return values
+
+
+def parse_dates(cells: List[str]) -> np.ndarray:
+    """Convert date cells to a datetime64[D] array; a cell that is no date becomes NaT.
+
+    Splitting the M/D/YYYY cells in Python beats pd.to_datetime with a format (bench_conversion.py).
+    """
+    try:
+        # The site renders M/D/YYYY; numpy parses the ISO form of a whole column at once
+        iso = []
+        for cell in cells:
+            month, day, year = cell.split('/')
+            iso.append(f"{year}-{int(month):02d}-{int(day):02d}")
+        return np.array(iso, dtype='datetime64[D]')
+    except ValueError:
+        # Anything else falls back to inference
+        return pd.to_datetime(pd.Series(cells, dtype=object), errors='coerce').to_numpy(dtype='datetime64[D]')
+
+
+def to_rows(columns: Dict[str, List[str]]) -> StockRows.StockRows:
+    """Convert raw string columns to validated, typed rows: the only conversion scraped cells go through."""
+    return StockRows.StockRows.from_arrays(parse_dates(columns['Date']), numeric_values(columns))
+
+
+def to_dataframe(columns: Dict[str, List[str]]) -> pd.DataFrame:
+    """Convert raw string columns to a typed DataFrame (datetime.date dates, numeric columns)."""
+    return to_rows(columns).to_frame()
+
+
+def parse_to_rows(html: str, table_id: str = 'resultsTable') -> Optional[StockRows.StockRows]:
+    """Parse and convert a page into typed rows; runs in worker processes, so it must stay module-level.
+
+    Returns None when the page has no results table.
+    """
+    columns = parse_results_table(html, table_id)
+    if columns is None:
+        return None
+    return to_rows(columns)
+
+
+def parse_market_day(html: str, day: date, table_id: str = 'resultsTable') -> Optional[StockRows.StockRows]:
+    """Parse a market-wide daily results page into typed rows with their issuer codes.
+
+    Every row gets the page's day as its date. Module-level for worker processes; None when the page
+    has no results table.
+    """
+    columns = parse_results_table(html, table_id, MARKET_COLUMN_NAMES)
+    if columns is None:
+        return None
+    issuer_codes = [code.strip().upper() for code in columns['Issuer code']]
+    days = np.full(len(issuer_codes), np.datetime64(day, 'D'))
+    return StockRows.StockRows.from_arrays(days, numeric_values(columns), issuer_codes)
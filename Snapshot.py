@@ -0,0 +1,169 @@
+import json
+import os
+from datetime import date, datetime
+from typing import Dict, List, Optional
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # Snapshots fall back to compressed numpy archives when pyarrow is not installed
+    pa = None
+    feather = None
+
+MANIFEST_NAME = 'manifest.json'
+SNAPSHOT_VERSION = 1
+
+# Column name in the snapshot files -> stock_data column, in stock_data order after the date
+SNAPSHOT_COLUMNS = {
+    'last_trade_price': 'Last Trade Price',
+    'max_price': 'Max',
+    'min_price': 'Min',
+    'volume': 'Volume',
+    'turnover_best': 'Turnover in BEST (denars)'
+}
+
+
+def default_format() -> str:
+    return 'feather' if feather is not None else 'npz'
+
+
+def _file_name(issuer_code: str, fmt: str) -> str:
+    safe = ''.join(c if c.isalnum() or c in '-_' else '_' for c in issuer_code)
+    return f"{safe}.{fmt}"
+
+
+def write_issuer(path: str, arrays: Dict[str, np.ndarray], fmt: str, compression: Optional[str]):
+    """One issuer's columns as an Arrow IPC (feather) file or a numpy archive."""
+    if fmt == 'feather':
+        # Uncompressed files can be memory-mapped without copying on import
+        feather.write_feather(pa.table(arrays), path, compression=compression or 'uncompressed')
+    elif compression:
+        np.savez_compressed(path, **arrays)
+    else:
+        np.savez(path, **arrays)
+
+
+def read_issuer(path: str, fmt: str) -> Dict[str, np.ndarray]:
+    if fmt == 'feather':
+        table = feather.read_table(path, memory_map=True)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+    with np.load(path) as archive:
+        return {name: archive[name] for name in archive.files}
+
+
+def read_manifest(directory: str) -> Dict:
+    """The snapshot's manifest; a directory without one holds no complete snapshot."""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        raise ValueError(f"No snapshot manifest in {directory}")
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {manifest.get('version')}")
+    if manifest['format'] == 'feather' and feather is None:
+        raise ValueError("pyarrow is required to import a feather snapshot")
+    return manifest
+
+
+def export_snapshot(db_manager, directory: str, issuer_codes: Optional[List[str]] = None,
+                    fmt: Optional[str] = None, compression: Optional[str] = 'zstd') -> Dict:
+    """Write stock_data as one columnar file per issuer plus a manifest with each issuer's last date.
+
+    Each file holds the day number (days since 1970-01-01) and the numeric columns of stock_data.
+    The manifest also carries the issuers' scrape_journal windows, so the importing node knows exactly
+    which ranges were fetched, gaps included. It is written last, so an interrupted export never looks
+    like a complete snapshot.
+    """
+    fmt = fmt or default_format()
+    if fmt not in ('feather', 'npz'):
+        raise ValueError(f"Unknown snapshot format: {fmt}")
+    if fmt == 'feather' and feather is None:
+        raise ValueError("pyarrow is required for feather snapshots")
+    os.makedirs(directory, exist_ok=True)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'format': fmt,
+        'compression': compression,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'issuers': {},
+        'journal': {}
+    }
+    codes = issuer_codes if issuer_codes is not None else sorted(db_manager.get_last_dates())
+    journal = db_manager.get_journal()
+    # Issuers journaled without any rows (only empty windows) are exported too: no need to fetch them again
+    for issuer_code in sorted(journal) if issuer_codes is None else codes:
+        manifest['journal'][issuer_code] = [
+            [window_start.isoformat(), covered_from.isoformat(), fetched_through.isoformat(), status]
+            for window_start, (covered_from, fetched_through, status) in sorted(journal.get(issuer_code, {}).items())
+        ]
+    for issuer_code in codes:
+        frame = db_manager.load_issuer_frame(issuer_code)
+        if frame.empty:
+            continue
+        days = frame['Date'].to_numpy(dtype='datetime64[D]')
+        arrays = {'day': days.astype(np.int32)}
+        for name, column in SNAPSHOT_COLUMNS.items():
+            arrays[name] = frame[column].to_numpy(dtype=np.float64)
+
+        file_name = _file_name(issuer_code, fmt)
+        path = os.path.join(directory, file_name)
+        write_issuer(path, arrays, fmt, compression)
+        manifest['issuers'][issuer_code] = {
+            'file': file_name,
+            'rows': len(days),
+            'first_date': str(days[0]),
+            'last_date': str(days[-1]),
+            'bytes': os.path.getsize(path)
+        }
+
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+def snapshot_rows(issuer_code: str, arrays: Dict[str, np.ndarray], compact: bool) -> List[tuple]:
+    """Row tuples in the form StockRows.tuples produces, built column-wise from a snapshot file."""
+    days = arrays['day'].astype(np.int64)
+    dates = days.tolist() if compact else days.astype('datetime64[D]').astype(str).tolist()
+    # NaN binds as NULL, so missing values need no conversion
+    values = [arrays[name].astype(np.float64).tolist() for name in SNAPSHOT_COLUMNS]
+    return list(zip([issuer_code] * len(dates), dates, *values))
+
+
+def import_snapshot(db_manager, directory: str) -> Dict[str, int]:
+    """Load a snapshot into the database in one transaction; returns the rows read per issuer.
+
+    Rows are upserted, so importing into a non-empty database keeps its other issuers and dates.
+    The exported journal windows are merged into scrape_journal, so the next update fetches what came
+    after the snapshot and the gaps the source had not fetched. A snapshot without a journal is assumed
+    complete from each issuer's first to its last date. The activity index gets the last trades.
+    """
+    manifest = read_manifest(directory)
+    imported = {}
+    first_dates = {}
+    last_dates = {}
+    with db_manager.conn as conn:
+        for issuer_code, entry in manifest['issuers'].items():
+            arrays = read_issuer(os.path.join(directory, entry['file']), manifest['format'])
+            rows = snapshot_rows(issuer_code, arrays, db_manager.compact)
+            db_manager.upsert_rows(conn, rows)
+            imported[issuer_code] = len(rows)
+            first_dates[issuer_code] = date.fromisoformat(entry['first_date'])
+            last_dates[issuer_code] = date.fromisoformat(entry['last_date'])
+        if db_manager.analytics is not None:
+            # The manifest already knows each issuer's earliest row, so there is no need to scan the batch
+            db_manager.analytics.mark_pending(conn, first_dates)
+        db_manager.bump_ingest_version(conn)
+        if 'journal' in manifest:
+            db_manager.record_journal(conn, manifest['journal'])
+        else:
+            db_manager.journal_history(conn, last_dates, first_dates)
+        # Known last trades; last_checked stays empty so every issuer is checked on the next update
+        db_manager.record_activity(conn, last_dates)
+    db_manager.frame_cache.invalidate()
+    db_manager.apply_analytics()
+    return imported
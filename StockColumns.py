@@ -0,0 +1,26 @@
+from datetime import date, timedelta
+
+# Standard library only: StockReader imports this and must stay free of numpy and pandas
+
+# stock_data value columns (after issuer_code and Date), in table order, and their names in the compact
+# stock_rows table; every value column is stored as REAL
+COMPACT_NAMES = {
+    'Last Trade Price': 'last_trade_price',
+    'Max': 'max_price',
+    'Min': 'min_price',
+    'Volume': 'volume',
+    'Turnover in BEST (denars)': 'turnover_best'
+}
+
+VALUE_COLUMNS = list(COMPACT_NAMES)
+
+# Day 0 of the compact layout's day numbers
+EPOCH = date(1970, 1, 1)
+
+
+def to_day(value: date) -> int:
+    return (value - EPOCH).days
+
+
+def from_day(day: int) -> date:
+    return EPOCH + timedelta(days=day)
@@ -0,0 +1,116 @@
+import os
+import sqlite3
+from datetime import date
+from pathlib import Path
+from typing import List, Optional
+import StockColumns
+
+# stock_data columns and their names in the compact stock_rows table
+COLUMNS = StockColumns.COMPACT_NAMES
+
+
+class StockReader:
+    """Read-only access to the stored rows with the standard library only.
+
+    Meant for quick queries (command line, services) that should not pay for importing pandas.
+    The database is opened read-only, so nothing is created or migrated and the write lock is
+    never taken; in WAL mode it reads alongside a running writer.
+    """
+
+    def __init__(self, db_path: str = 'mse_stocks.db'):
+        self.db_path = db_path
+        if not os.path.exists(db_path):
+            raise ValueError(f"Database not found: {db_path}")
+        uri = Path(db_path).resolve().as_uri() + '?mode=ro'
+        self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        stock_data_type = self.conn.execute("SELECT type FROM sqlite_master WHERE name = 'stock_data'").fetchone()
+        if stock_data_type is None:
+            self.conn.close()
+            raise ValueError(f"{db_path} has no stock_data table")
+        self.compact = stock_data_type[0] == 'view'
+
+    def close(self):
+        self.conn.close()
+
+    def ingest_version(self) -> int:
+        """Counter the writers bump with every write of rows; 0 before any writer created it."""
+        try:
+            row = self.conn.execute("SELECT version FROM ingest_state WHERE id = 1").fetchone()
+        except sqlite3.OperationalError:
+            return 0
+        return row[0] if row else 0
+
+    def issuer_codes(self) -> List[str]:
+        """Codes of every issuer with stored rows."""
+        if self.compact:
+            query = ("SELECT i.issuer_code FROM issuers i "
+                     "WHERE EXISTS (SELECT 1 FROM stock_rows r WHERE r.issuer_id = i.issuer_id) ORDER BY i.issuer_code")
+        else:
+            query = "SELECT DISTINCT issuer_code FROM stock_data ORDER BY issuer_code"
+        return [code for code, in self.conn.execute(query)]
+
+    def rows(self, issuer_code: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+             columns: Optional[List[str]] = None, ascending: bool = True, limit: Optional[int] = None) -> List[tuple]:
+        """Rows of one issuer between two dates (both inclusive): the ISO date followed by the requested columns."""
+        columns = columns or list(COLUMNS)
+        unknown = [col for col in columns if col not in COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+        if self.compact:
+            # Bounds on the day numbers keep this a range scan of stock_rows' primary key
+            selected = ", ".join(f"r.{COLUMNS[col]}" for col in columns)
+            query = (f"SELECT date(r.day * 86400, 'unixepoch'), {selected} FROM stock_rows r "
+                     f"JOIN issuers i ON i.issuer_id = r.issuer_id WHERE i.issuer_code = ?")
+            key = "r.day"
+            bounds = [None if day is None else StockColumns.to_day(day) for day in (start_date, end_date)]
+        else:
+            selected = ", ".join(f'"{col}"' for col in columns)
+            query = f'SELECT "Date", {selected} FROM stock_data WHERE issuer_code = ?'
+            key = '"Date"'
+            bounds = [None if day is None else day.isoformat() for day in (start_date, end_date)]
+
+        params = [issuer_code]
+        if bounds[0] is not None:
+            query += f" AND {key} >= ?"
+            params.append(bounds[0])
+        if bounds[1] is not None:
+            query += f" AND {key} <= ?"
+            params.append(bounds[1])
+        query += f" ORDER BY {key}" + ("" if ascending else " DESC")
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return self.conn.execute(query, params).fetchall()
+
+    def issuer_summary(self) -> List[tuple]:
+        """(issuer_code, first date, last date, rows) for every issuer with stored rows."""
+        if self.compact:
+            query = ("SELECT i.issuer_code, date(MIN(r.day) * 86400, 'unixepoch'), "
+                     "date(MAX(r.day) * 86400, 'unixepoch'), COUNT(*) "
+                     "FROM stock_rows r JOIN issuers i ON i.issuer_id = r.issuer_id "
+                     "GROUP BY r.issuer_id ORDER BY i.issuer_code")
+        else:
+            query = ('SELECT issuer_code, MIN("Date"), MAX("Date"), COUNT(*) FROM stock_data '
+                     'GROUP BY issuer_code ORDER BY issuer_code')
+        return self.conn.execute(query).fetchall()
+
+    def latest_rows(self, issuer_codes: Optional[List[str]] = None) -> List[tuple]:
+        """The newest row of each issuer (all issuers by default): issuer_code, ISO date and every column."""
+        codes = issuer_codes if issuer_codes is not None else self.issuer_codes()
+        if self.compact:
+            selected = ", ".join(f"r.{name}" for name in COLUMNS.values())
+            query = (f"SELECT i.issuer_code, date(r.day * 86400, 'unixepoch'), {selected} FROM stock_rows r "
+                     f"JOIN issuers i ON i.issuer_id = r.issuer_id WHERE i.issuer_code = ? "
+                     f"ORDER BY r.day DESC LIMIT 1")
+        else:
+            selected = ", ".join(f'"{col}"' for col in COLUMNS)
+            query = (f'SELECT issuer_code, "Date", {selected} FROM stock_data WHERE issuer_code = ? '
+                     f'ORDER BY "Date" DESC LIMIT 1')
+        # One descending probe of the primary key per issuer instead of grouping the whole table
+        rows = []
+        for issuer_code in codes:
+            row = self.conn.execute(query, (issuer_code,)).fetchone()
+            if row is not None:
+                rows.append(row)
+        return rows
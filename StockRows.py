@@ -0,0 +1,121 @@
+from datetime import date
+from typing import Iterable, List, Optional
+import numpy as np
+import pandas as pd
+import StockColumns
+
+# stock_data columns after issuer_code and Date, in table order; all are stored as REAL
+VALUE_COLUMNS = StockColumns.VALUE_COLUMNS
+
+
+class StockRows:
+    """Typed rows of stock_data, held column-wise: the single form scraped data takes from parser to writer.
+
+    days is a datetime64[D] array, values a float64 array with one row per VALUE_COLUMNS entry (NaN for a
+    missing value) and issuer_codes an object array, or None when the rows belong to an issuer given by
+    the caller. Instances are built through from_arrays, which validates them once; everything after that
+    only slices or concatenates. Plain arrays pickle as flat buffers, so pages parsed in worker processes
+    come back in this form too. dropped counts the rows from_arrays discarded because their date could
+    not be parsed: such a batch is not the complete content of its page.
+    """
+
+    __slots__ = ('days', 'values', 'issuer_codes', 'dropped')
+
+    def __init__(self, days: np.ndarray, values: np.ndarray, issuer_codes: Optional[np.ndarray] = None,
+                 dropped: int = 0):
+        self.days = days
+        self.values = values
+        self.issuer_codes = issuer_codes
+        self.dropped = dropped
+
+    @classmethod
+    def from_arrays(cls, days, values, issuer_codes=None) -> 'StockRows':
+        """Validate parsed columns: rows without a date are dropped, and of several rows for the same
+        issuer and day only the last is kept, as the upsert would."""
+        days = np.asarray(days, dtype='datetime64[D]')
+        values = np.asarray(values, dtype=np.float64).reshape(len(VALUE_COLUMNS), -1)
+        if values.shape[1] != len(days):
+            raise ValueError(f"{len(days)} dates but {values.shape[1]} rows of values")
+        if issuer_codes is not None:
+            issuer_codes = np.asarray(issuer_codes, dtype=object)
+            if len(issuer_codes) != len(days):
+                raise ValueError(f"{len(days)} dates but {len(issuer_codes)} issuer codes")
+
+        keep = ~np.isnat(days)
+        dropped = int(len(days) - keep.sum())
+        # A page lists one issuer's days in strictly falling (or rising) order, which rules out repeats
+        steps = np.diff(days.astype(np.int64))
+        if issuer_codes is not None or not (np.all(steps < 0) or np.all(steps > 0)):
+            keys = pd.Index(days) if issuer_codes is None else pd.MultiIndex.from_arrays([issuer_codes, days])
+            keep &= ~keys.duplicated(keep='last')
+        if not keep.all():
+            days = days[keep]
+            values = values[:, keep]
+            issuer_codes = issuer_codes[keep] if issuer_codes is not None else None
+        return cls(days, values, issuer_codes, dropped)
+
+    @classmethod
+    def empty_rows(cls) -> 'StockRows':
+        return cls(np.empty(0, dtype='datetime64[D]'), np.empty((len(VALUE_COLUMNS), 0)))
+
+    @classmethod
+    def concat(cls, parts: Iterable['StockRows']) -> 'StockRows':
+        """Rows of several batches in order; issuer codes are kept only if every batch has them."""
+        parts = list(parts)
+        if not parts:
+            return cls.empty_rows()
+        if len(parts) == 1:
+            return parts[0]
+        issuer_codes = None
+        if all(part.issuer_codes is not None for part in parts):
+            issuer_codes = np.concatenate([part.issuer_codes for part in parts])
+        return cls(np.concatenate([part.days for part in parts]),
+                   np.concatenate([part.values for part in parts], axis=1), issuer_codes,
+                   sum(part.dropped for part in parts))
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.days) == 0
+
+    def select(self, mask: np.ndarray) -> 'StockRows':
+        """The rows where a boolean mask is set."""
+        return StockRows(self.days[mask], self.values[:, mask],
+                         self.issuer_codes[mask] if self.issuer_codes is not None else None)
+
+    def for_issuers(self, issuer_codes: Iterable[str]) -> 'StockRows':
+        """The rows of the given issuers; needs per-row issuer codes."""
+        return self.select(np.isin(self.issuer_codes, list(issuer_codes)))
+
+    def last_date(self) -> Optional[date]:
+        if self.empty:
+            return None
+        return self.days.max().item()
+
+    def tuples(self, compact: bool, issuer_code: Optional[str] = None) -> List[tuple]:
+        """Row tuples in stock_data column order, ready for executemany.
+
+        Dates become ISO text, or day numbers for the compact layout, whose writer swaps the codes for
+        issuer ids. NaN binds as NULL, so missing values need no conversion. Without an issuer_code the
+        rows' own codes are used.
+        """
+        if issuer_code is not None:
+            codes = [issuer_code] * len(self.days)
+        elif self.issuer_codes is not None:
+            codes = self.issuer_codes.tolist()
+        else:
+            raise ValueError("Rows without issuer codes need an issuer_code")
+        dates = self.days.astype(np.int64).tolist() if compact else self.days.astype(str).tolist()
+        return list(zip(codes, dates, *self.values.tolist()))
+
+    def to_frame(self) -> pd.DataFrame:
+        """The rows as a DataFrame with datetime.date dates, led by an issuer_code column when the rows have codes."""
+        data = {}
+        if self.issuer_codes is not None:
+            data['issuer_code'] = self.issuer_codes
+        data['Date'] = self.days.astype(object)  # datetime64[D] -> datetime.date
+        for name, column in zip(VALUE_COLUMNS, self.values):
+            data[name] = column
+        return pd.DataFrame(data)
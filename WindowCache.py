@@ -0,0 +1,172 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date
+from typing import Optional, Dict
+
+
+class WindowCache:
+    """On-disk cache of raw symbolhistory pages keyed by (issuer, FromDate, ToDate).
+
+    Trading data of a window that ended before today never changes, so such pages are served from disk
+    without a request. Pages of the open window are kept together with their validators and revalidated.
+    An open window's range moves every day (it runs from the day after the last fetch to today), so it is
+    keyed by issuer and year only: each fetch replaces the previous one instead of leaving a page under
+    a key no later request uses. Serving it still needs the server's 304 for the requested range.
+    """
+
+    def __init__(self, cache_dir: str = 'window_cache', max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total_bytes = None  # Computed lazily from the files on disk
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @classmethod
+    def key(cls, issuer_code: str, from_date: str, to_date: str) -> str:
+        if cls.is_closed(to_date):
+            name = f"{issuer_code}|{from_date}|{to_date}"
+        else:
+            name = f"{issuer_code}|{to_date[:4]}|open"
+        return hashlib.sha256(name.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_closed(to_date: str) -> bool:
+        """A window is closed once it ends before today."""
+        return date.fromisoformat(to_date) < date.today()
+
+    def _paths(self, key: str):
+        directory = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(directory, f"{key}.html.gz"), os.path.join(directory, f"{key}.json")
+
+    def get(self, issuer_code: str, from_date: str, to_date: str) -> Optional[Dict]:
+        """Return the cached entry ({'html', 'closed', 'etag', 'last_modified'}) or None."""
+        body_path, meta_path = self._paths(self.key(issuer_code, from_date, to_date))
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with gzip.open(body_path, 'rt', encoding='utf-8') as f:
+                meta['html'] = f.read()
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        # Mark as recently used for eviction
+        now = time.time()
+        try:
+            os.utime(body_path, (now, now))
+        except OSError:
+            pass
+
+        # A stored open window may have become closed since, but its page could still be incomplete
+        if meta.get('closed'):
+            with self.lock:
+                self.hits += 1
+        return meta
+
+    def record_revalidated(self):
+        """Count an open window whose cached page was confirmed unchanged by the server."""
+        with self.lock:
+            self.hits += 1
+            self.revalidated += 1
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def put(self, issuer_code: str, from_date: str, to_date: str, html: str,
+            etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Store a page; closed windows are kept until evicted, the open window until it is refetched."""
+        key = self.key(issuer_code, from_date, to_date)
+        body_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+
+        old_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+        meta = {
+            'issuer_code': issuer_code,
+            'from_date': from_date,
+            'to_date': to_date,
+            'closed': self.is_closed(to_date),
+            'etag': etag,
+            'last_modified': last_modified,
+            'stored_at': time.time()
+        }
+
+        # Write to temporary files first so readers never see a half-written entry
+        with gzip.open(f"{body_path}.tmp", 'wt', encoding='utf-8') as f:
+            f.write(html)
+        with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(f"{body_path}.tmp", body_path)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+        with self.lock:
+            self.stores += 1
+            self._ensure_size()
+            self.total_bytes += os.path.getsize(body_path) - old_size
+            over_limit = self.total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def _ensure_size(self):
+        if self.total_bytes is None:
+            self.total_bytes = sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        """Yield (last_used, body_path, size) for every cached page."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for directory, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.html.gz'):
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, path, stat.st_size
+
+    def evict(self):
+        """Delete least recently used pages until the cache is below 90% of its size limit."""
+        with self.lock:
+            target = self.max_bytes * 0.9
+            entries = sorted(self._entries())
+            total = sum(size for _, _, size in entries)
+            for _, body_path, size in entries:
+                if total <= target:
+                    break
+                meta_path = body_path[:-len('.html.gz')] + '.json'
+                for path in (body_path, meta_path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+                self.evictions += 1
+            self.total_bytes = total
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated,
+                'stores': self.stores,
+                'evictions': self.evictions
+            }
+
+    def report(self) -> str:
+        stats = self.stats()
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / lookups * 100 if lookups else 0.0
+        return (f"Window cache: {stats['hits']} hits ({stats['revalidated']} revalidated), "
+                f"{stats['misses']} misses, {hit_rate:.1f}% hit rate, {stats['evictions']} evictions")
@@ -0,0 +1,187 @@
+"""Micro-benchmark of turning parsed table cells into database rows, per 10k rows.
+
+Compares the previous path, where the cells were converted three times (ResultsTableParser.to_dataframe,
+clean_numeric per cell in DataScraper.clean_data, then the copy, replace, to_numeric and to_datetime of
+DatabaseManager.prepare_rows), with the single conversion into StockRows that the writer stores as is.
+CPU time comes from process_time, memory from tracemalloc (peak while converting, and how much of it
+is intermediates rather than the returned rows). It also times the per-cell number and date conversion
+of ResultsTableParser against the vectorized pandas conversion it replaced, on the same pages:
+
+    python benchmarks/bench_conversion.py [--rows 10000] [--page-days 365] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pandas as pd
+import ResultsTableParser
+import StockRows
+from synthetic_pages import symbolhistory_page
+
+STOCK_COLUMNS = ['issuer_code', 'Date'] + StockRows.VALUE_COLUMNS
+
+
+def clean_numeric(value):
+    """Per-cell number cleaning of the old path."""
+    if pd.isna(value):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return float(value.replace(',', '').replace(' ', ''))
+    return None
+
+
+def convert_three_passes(columns, issuer_code: str, compact: bool):
+    """The path before StockRows: parser DataFrame, cleaning stage, then prepare_rows in the writer."""
+    # ResultsTableParser.to_dataframe
+    data = {}
+    for name in StockRows.VALUE_COLUMNS:
+        series = pd.Series(columns[name], dtype=object)
+        cleaned = series.str.replace(',', '', regex=False).str.replace(' ', '', regex=False)
+        data[name] = pd.to_numeric(cleaned.replace('', None), errors='coerce').to_numpy()
+    dates = pd.to_datetime(pd.Series(columns['Date'], dtype=object), format='%m/%d/%Y')
+    data['Date'] = dates.to_numpy(dtype='datetime64[D]').astype(object)
+    df = pd.DataFrame(data, columns=ResultsTableParser.COLUMNS_TO_KEEP).drop_duplicates()
+
+    # DataScraper.clean_data
+    for col in df.columns:
+        if col != 'Date':
+            df[col] = df[col].apply(clean_numeric)
+
+    # DatabaseManager.prepare_rows
+    save_df = df.copy()
+    save_df['issuer_code'] = issuer_code
+    save_df = save_df[STOCK_COLUMNS]
+    save_df = save_df.replace(['', 'None', 'NULL'], None)
+    for col in StockRows.VALUE_COLUMNS:
+        save_df[col] = pd.to_numeric(save_df[col], errors='coerce')
+    if compact:
+        dates = pd.to_datetime(save_df['Date'])
+        save_df = save_df[dates.notna()].copy()
+        save_df['Date'] = dates[dates.notna()].to_numpy(dtype='datetime64[D]').astype('int64')
+    else:
+        save_df['Date'] = pd.to_datetime(save_df['Date']).dt.strftime("%Y-%m-%d")
+    save_df = save_df.astype(object).where(save_df.notna(), None)
+    return list(save_df.itertuples(index=False, name=None))
+
+
+def numeric_values_vectorized(columns):
+    """Whole-column pandas string operations, as ResultsTableParser converted numbers before StockRows."""
+    values = []
+    for name in StockRows.VALUE_COLUMNS:
+        series = pd.Series(columns[name], dtype=object)
+        cleaned = series.str.replace(',', '', regex=False).str.replace(' ', '', regex=False)
+        values.append(pd.to_numeric(cleaned.replace('', None), errors='coerce').to_numpy(dtype=np.float64))
+    return np.array(values)
+
+
+def parse_dates_vectorized(cells):
+    return pd.to_datetime(pd.Series(cells, dtype=object), format='%m/%d/%Y').to_numpy(dtype='datetime64[D]')
+
+
+def compare_cell_conversion(pages, repeat: int, scale: float):
+    """Per-cell loops against vectorized pandas, for the numbers and the dates of every page."""
+    for columns in pages:
+        if not (np.array_equal(ResultsTableParser.numeric_values(columns), numeric_values_vectorized(columns),
+                               equal_nan=True)
+                and np.array_equal(ResultsTableParser.parse_dates(columns['Date']),
+                                   parse_dates_vectorized(columns['Date']))):
+            raise SystemExit("The cell conversions disagree")
+
+    rows_per_page = sum(len(columns['Date']) for columns in pages) / len(pages)
+    print(f"\nCell conversion, {rows_per_page:.0f} rows per page; figures per 10k rows")
+    for kind, loop, vectorized in (
+            ("numbers", ResultsTableParser.numeric_values, numeric_values_vectorized),
+            ("dates", lambda columns: ResultsTableParser.parse_dates(columns['Date']),
+             lambda columns: parse_dates_vectorized(columns['Date']))):
+        timings = []
+        for func in (loop, vectorized):
+            start = time.process_time()
+            for _ in range(repeat):
+                for columns in pages:
+                    func(columns)
+            timings.append((time.process_time() - start) / repeat)
+        print(f"{kind:<8} per cell {timings[0] * scale * 1000:7.1f} ms CPU, vectorized pandas "
+              f"{timings[1] * scale * 1000:7.1f} ms CPU ({timings[1] / timings[0]:.1f}x)")
+
+
+def convert_once(columns, issuer_code: str, compact: bool):
+    return ResultsTableParser.to_rows(columns).tuples(compact, issuer_code)
+
+
+def same_rows(expected, actual) -> bool:
+    # The old path binds None for a missing value, the new one NaN; SQLite stores both as NULL
+    def normalized(rows):
+        return [tuple(None if value != value else value for value in row) for row in rows]
+    return normalized(expected) == normalized(actual)
+
+
+def measure(func, pages, compact: bool, repeat: int):
+    """(CPU seconds, peak traced bytes, bytes still held by the results) of converting every page."""
+    func(pages[0], 'ALK', compact)  # Warm up
+
+    start = time.process_time()
+    for _ in range(repeat):
+        for columns in pages:
+            func(columns, 'ALK', compact)
+    cpu = (time.process_time() - start) / repeat
+
+    # Allocations are traced in a separate run: tracing slows every allocation down
+    tracemalloc.start()
+    results = [func(columns, 'ALK', compact) for columns in pages]
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return cpu, peak, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cells-to-rows conversion benchmark")
+    parser.add_argument('--rows', type=int, default=10000, help="Rows converted per measurement")
+    parser.add_argument('--page-days', type=int, default=365,
+                        help="Days per page; the scraper fetches one calendar year per request")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    # Consecutive pages going back far enough for the rows (weekdays only), parsed once: only the
+    # conversion after parsing is measured
+    pages = []
+    end = date.today()
+    rows = 0
+    while rows < args.rows:
+        start = end - timedelta(days=args.page_days - 1)
+        pages.append(ResultsTableParser.parse_results_table(symbolhistory_page(start, end)))
+        rows += len(pages[-1]['Date'])
+        end = start - timedelta(days=1)
+    scale = 10000 / rows
+
+    compare_cell_conversion(pages, args.repeat, scale)
+
+    for compact in (False, True):
+        # Both paths must agree before their numbers mean anything
+        for columns in pages:
+            if not same_rows(convert_three_passes(columns, 'ALK', compact), convert_once(columns, 'ALK', compact)):
+                raise SystemExit(f"The conversions disagree (compact={compact})")
+
+        layout = 'compact' if compact else 'text dates'
+        print(f"\n{rows} rows in {len(pages)} pages, {layout}; figures per 10k rows")
+        baseline = None
+        for name, func in (("three passes (DataFrame)", convert_three_passes), ("StockRows", convert_once)):
+            cpu, peak, held = measure(func, pages, compact, args.repeat)
+            print(f"{name:<26} {cpu * scale * 1000:8.1f} ms CPU {peak * scale / 1024:10,.0f} KiB peak "
+                  f"({(peak - held) * scale / 1024:,.0f} KiB beyond the rows returned)")
+            if baseline is None:
+                baseline = (cpu, peak)
+            else:
+                print(f"CPU: {baseline[0] / cpu:.1f}x less, peak memory: {baseline[1] / peak:.1f}x less")
+
+
+if __name__ == "__main__":
+    main()
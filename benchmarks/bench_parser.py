@@ -0,0 +1,92 @@
+"""Micro-benchmark of the symbolhistory table parser.
+
+Compares the previous BeautifulSoup + str(table) + pd.read_html + clean_numeric path with
+ResultsTableParser. Pass recorded pages as arguments, otherwise a synthetic one-year page is used:
+
+    python benchmarks/bench_parser.py [page.html ...]
+"""
+import os
+import sys
+import time
+import warnings
+from datetime import date, timedelta
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pandas as pd
+from bs4 import BeautifulSoup
+import ResultsTableParser
+from synthetic_pages import symbolhistory_page
+
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+
+def clean_numeric(value):
+    """Per-cell number cleaning of the old path."""
+    if pd.isna(value):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return float(value.replace(',', '').replace(' ', ''))
+    return None
+
+
+def parse_with_read_html(html: str):
+    """The parsing path of MSEStockScraper before ResultsTableParser."""
+    soup = BeautifulSoup(html, "html.parser")
+    table = soup.find("table", id="resultsTable")
+    if not table:
+        return None
+    df = pd.read_html(StringIO(str(table)), header=None)[0]
+    df.columns = ResultsTableParser.COLUMN_NAMES
+    df = df[ResultsTableParser.COLUMNS_TO_KEEP]
+    for col in ResultsTableParser.NUMERIC_COLUMNS:
+        df[col] = df[col].apply(clean_numeric)
+    df['Date'] = pd.to_datetime(df['Date']).dt.date
+    return df
+
+
+def parse_with_results_table_parser(html: str):
+    columns = ResultsTableParser.parse_results_table(html)
+    return ResultsTableParser.to_dataframe(columns) if columns is not None else None
+
+
+def bench(name, func, pages, repeat):
+    func(pages[0])  # Warm up
+    start = time.perf_counter()
+    rows = 0
+    for _ in range(repeat):
+        for page in pages:
+            rows += len(func(page))
+    elapsed = time.perf_counter() - start
+    per_page = elapsed / (repeat * len(pages)) * 1000
+    print(f"{name:<32} {per_page:8.2f} ms/page {rows / elapsed:12,.0f} rows/s")
+    return elapsed
+
+
+def main():
+    if len(sys.argv) > 1:
+        pages = []
+        for path in sys.argv[1:]:
+            with open(path, encoding='utf-8') as f:
+                pages.append(f.read())
+    else:
+        today = date.today()
+        pages = [symbolhistory_page(today - timedelta(days=365), today)]
+
+    # Both paths must agree before their timings mean anything
+    expected = parse_with_read_html(pages[0])
+    actual = parse_with_results_table_parser(pages[0])
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual, check_dtype=False)
+
+    repeat = 20
+    baseline = bench("BeautifulSoup + read_html", parse_with_read_html, pages, repeat)
+    fast = bench("ResultsTableParser (lxml)" if ResultsTableParser.lxml_etree else "ResultsTableParser (stdlib)",
+                 parse_with_results_table_parser, pages, repeat)
+    print(f"Speed-up: {baseline / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""End-to-end benchmark of IssuerCodeExtractor -> DatabaseManager -> DataScraper against the local stand-in.
+
+The stand-in runs in its own process so it does not compete with the pipeline for the event loop.
+Everything is written to a temporary directory, so every run starts cold:
+
+    python benchmarks/run_pipeline_benchmark.py --issuers 50 --latency 0.05 --error-rate 0.01 --json result.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import DataScraper
+import DatabaseManager
+import IssuerCodeExtractor
+import stand_in_server
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(base_url: str, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/_stats", timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Stand-in server did not start at {base_url}")
+
+
+def server_stats(base_url: str) -> dict:
+    return json.loads(urllib.request.urlopen(f"{base_url}/_stats", timeout=5).read())
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+async def run_pipeline(base_url: str, workdir: str, args) -> dict:
+    stages = {}
+
+    start = time.perf_counter()
+    extractor = IssuerCodeExtractor.IssuerCodeExtractor(cache_path=os.path.join(workdir, 'issuer_codes.json'),
+                                                        base_url=base_url)
+    issuer_codes = extractor.filter_codes(await extractor.get_issuer_codes_async())
+    stages['issuer_discovery'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    db_manager = DatabaseManager.DatabaseManager(os.path.join(workdir, 'bench.db'), compact=args.compact)
+    update_info = db_manager.check_data_currency(issuer_codes, from_listing=extractor.listing_complete)
+    stages['data_currency'] = time.perf_counter() - start
+
+    scraper = DataScraper.DataScraper(db_manager, base_url=base_url, use_window_cache=not args.no_cache,
+                                      cache_dir=os.path.join(workdir, 'window_cache'),
+                                      verbose=args.verbose, metrics_dir=args.metrics_dir,
+                                      parse_processes=args.parse_processes)
+    start = time.perf_counter()
+    await scraper.update_data(update_info=update_info, max_concurrent_tasks=args.workers)
+    stages['scrape_and_store'] = time.perf_counter() - start
+
+    rows = db_manager.conn.execute("SELECT COUNT(*) FROM stock_data").fetchone()[0]
+    db_manager.close()
+    return {
+        'issuers': len(issuer_codes),
+        'rows': rows,
+        'errors': len(scraper.errors),
+        'stages': stages,
+        'rows_per_sec': rows / stages['scrape_and_store'] if stages['scrape_and_store'] else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument('--issuers', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--recorded-dir', default=None)
+    parser.add_argument('--workers', type=int, default=200)
+    parser.add_argument('--parse-processes', type=int, default=0,
+                        help="Parse pages in a process pool of this size (0: threads of the main process)")
+    parser.add_argument('--compact', action='store_true', help="Store rows in the compact schema")
+    parser.add_argument('--no-cache', action='store_true', help="Disable the window cache")
+    parser.add_argument('--json', default=None, help="Also write the results to this file")
+    parser.add_argument('--metrics-dir', default=None, help="Export the per-stage metrics (JSON + Prometheus) here")
+    parser.add_argument('--verbose', action='store_true', help="Print one line per window instead of progress")
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server_args = stand_in_server.build_parser().parse_args([
+        '--port', str(port), '--issuers', str(args.issuers), '--latency', str(args.latency),
+        '--jitter', str(args.jitter), '--error-rate', str(args.error_rate)
+    ] + (['--recorded-dir', args.recorded_dir] if args.recorded_dir else []))
+    server = multiprocessing.Process(target=stand_in_server.serve, args=(server_args,), daemon=True)
+    server.start()
+    try:
+        wait_for_server(base_url)
+        with tempfile.TemporaryDirectory() as workdir:
+            start = time.perf_counter()
+            result = asyncio.run(run_pipeline(base_url, workdir, args))
+            result['total'] = time.perf_counter() - start
+        result['requests'] = server_stats(base_url)
+    finally:
+        server.terminate()
+        server.join()
+    result['peak_rss_mb'] = peak_rss_mb()
+
+    print("\n=== Pipeline benchmark ===")
+    print(f"Issuers: {result['issuers']}, rows: {result['rows']}, errors: {result['errors']}")
+    for stage, seconds in result['stages'].items():
+        print(f"{stage:<20} {seconds:8.2f} s")
+    print(f"{'total':<20} {result['total']:8.2f} s")
+    print(f"Rows/sec: {result['rows_per_sec']:,.0f}")
+    print(f"Peak RSS: {result['peak_rss_mb']:.1f} MB")
+    print(f"Requests served: {result['requests']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
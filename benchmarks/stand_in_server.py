@@ -0,0 +1,135 @@
+"""Local stand-in for the mse.mk pages used by the scraper.
+
+Serves synthetic (or recorded) symbolhistory pages, market-wide daily results pages
+(/en/stats/daily-results?date=YYYY-MM-DD) and the two issuer listing pages, with configurable
+latency and error injection, and counts the requests it receives (GET /_stats):
+
+    python benchmarks/stand_in_server.py --port 8080 --issuers 50 --latency 0.05 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import os
+import random
+import zlib
+from collections import Counter
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from aiohttp import web
+
+from synthetic_pages import symbolhistory_page, market_day_page, issuer_codes, listing_page
+
+
+class StandInServer:
+    def __init__(self, issuers: int = 50, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 recorded_dir: Optional[str] = None, seed: int = 0, holidays: Iterable[date] = ()):
+        self.codes = issuer_codes(issuers)
+        self.latency = latency  # Mean added response time in seconds
+        self.jitter = jitter  # Uniform +/- spread around the latency
+        self.error_rate = error_rate  # Share of symbolhistory requests answered with 503
+        self.recorded_dir = recorded_dir  # Optional directory of <CODE>.html pages served instead of synthetic ones
+        self.random = random.Random(seed)
+        self.holidays = set(holidays)  # Weekdays whose market page has no results table, like the real site
+        self.requests = Counter()
+        self.app = web.Application()
+        self.app.router.add_get('/en/stats/symbolhistory/{code}', self.symbolhistory)
+        self.app.router.add_get('/en/stats/daily-results', self.market_day)
+        self.app.router.add_get('/en/issuers/{listing}', self.listing)
+        self.app.router.add_get('/_stats', self.stats)
+        self.runner = None
+
+    async def delay(self):
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+    async def symbolhistory(self, request):
+        code = request.match_info['code']
+        self.requests['symbolhistory'] += 1
+        await self.delay()
+
+        if self.random.random() < self.error_rate:
+            self.requests['errors'] += 1
+            return web.Response(status=503, headers={'Retry-After': '1'})
+
+        if self.recorded_dir:
+            path = os.path.join(self.recorded_dir, f"{code}.html")
+            if os.path.exists(path):
+                return web.FileResponse(path, headers={'Content-Type': 'text/html'})
+
+        start = datetime.strptime(request.query['FromDate'], "%Y-%m-%d").date()
+        end = datetime.strptime(request.query['ToDate'], "%Y-%m-%d").date()
+        page = symbolhistory_page(start, end, seed=zlib.crc32(code.encode()))
+        return web.Response(text=page, content_type='text/html')
+
+    async def market_day(self, request):
+        """Market-wide results of one day (?date=YYYY-MM-DD), consistent with the symbolhistory pages."""
+        self.requests['market_day'] += 1
+        await self.delay()
+        if self.random.random() < self.error_rate:
+            self.requests['errors'] += 1
+            return web.Response(status=503, headers={'Retry-After': '1'})
+        day = datetime.strptime(request.query['date'], "%Y-%m-%d").date()
+        if day in self.holidays:
+            return web.Response(text="<html><body><p>No trading</p></body></html>", content_type='text/html')
+        page = market_day_page(day, {code: zlib.crc32(code.encode()) for code in self.codes})
+        return web.Response(text=page, content_type='text/html')
+
+    async def listing(self, request):
+        self.requests['listing'] += 1
+        await self.delay()
+        # Split the issuers over the two listing pages like the real site does
+        half = len(self.codes) // 2
+        if request.match_info['listing'] == 'free-market':
+            codes = self.codes[half:]
+        else:
+            codes = self.codes[:half]
+        return web.Response(text=listing_page(codes), content_type='text/html')
+
+    async def stats(self, request):
+        return web.json_response(dict(self.requests))
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Local stand-in for the mse.mk pages")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--issuers', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0, help="Added response time in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Uniform +/- spread of the latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument('--recorded-dir', default=None, help="Directory with recorded <CODE>.html pages")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+
+def serve(args):
+    """Run the stand-in until interrupted (also used as the benchmark's server process)."""
+    server = StandInServer(issuers=args.issuers, latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, recorded_dir=args.recorded_dir, seed=args.seed)
+
+    async def run():
+        await server.start(args.host, args.port)
+        print(f"Stand-in serving {len(server.codes)} issuers on http://{args.host}:{args.port}", flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    serve(build_parser().parse_args())
@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+
+
+def trade_cells(day: date, seed: int) -> str:
+    """The cells after the first one of an issuer's row for a day; both page kinds share them."""
+    price = 1000 + ((day.toordinal() + seed) % 97) * 10.5
+    volume = day.day * 3
+    turnover = price * volume
+    return (f"<td>{price:,.2f}</td><td>{price + 5:,.2f}</td><td>{price - 5:,.2f}</td>"
+            f"<td>{price:,.2f}</td><td>0.10</td><td>{volume:,}</td>"
+            f"<td>{turnover:,.0f}</td><td>{turnover:,.0f}</td>")
+
+
+def symbolhistory_page(start_date: date, end_date: date, seed: int = 0) -> str:
+    """Build a symbolhistory page with the same table layout as mse.mk for every weekday in the range."""
+    rows = []
+    current = end_date
+    while current >= start_date:
+        if current.weekday() < 5:
+            rows.append(f"<tr><td>{current.month}/{current.day}/{current.year}</td>{trade_cells(current, seed)}</tr>")
+        current -= timedelta(days=1)
+
+    return (
+        "<html><head><title>Symbol history</title></head><body>"
+        "<div class='row'><select id='Code'><option value='ADIN'>ADIN</option></select></div>"
+        "<table id='resultsTable' class='table'><thead><tr>"
+        "<th>Date</th><th>Last trade price</th><th>Max</th><th>Min</th><th>Avg. Price</th>"
+        "<th>%chg.</th><th>Volume</th><th>Turnover in BEST in denars</th><th>Total turnover in denars</th>"
+        "</tr></thead><tbody>" + "".join(rows) + "</tbody></table></body></html>"
+    )
+
+
+def market_day_page(day: date, seeds) -> str:
+    """Build a market-wide daily results page: one row per issuer (code -> seed) with the symbolhistory numbers.
+
+    Weekends get an empty table, like a day without trading.
+    """
+    rows = []
+    if day.weekday() < 5:
+        rows = [f"<tr><td>{code}</td>{trade_cells(day, seed)}</tr>" for code, seed in seeds.items()]
+    return (
+        "<html><head><title>Daily results</title></head><body>"
+        "<table id='resultsTable' class='table'><thead><tr>"
+        "<th>Symbol</th><th>Last trade price</th><th>Max</th><th>Min</th><th>Avg. Price</th>"
+        "<th>%chg.</th><th>Volume</th><th>Turnover in BEST in denars</th><th>Total turnover in denars</th>"
+        "</tr></thead><tbody>" + "".join(rows) + "</tbody></table></body></html>"
+    )
+
+
+def issuer_codes(count: int):
+    """Deterministic four-letter issuer codes (AAAA, AAAB, ...)."""
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    codes = []
+    for index in range(count):
+        code = ""
+        value = index
+        for _ in range(4):
+            code = letters[value % 26] + code
+            value //= 26
+        codes.append(code)
+    return codes
+
+
+def listing_page(codes) -> str:
+    """Build an issuer listing page with the otherlisting-table layout."""
+    rows = "".join(f"<tr><td>{code}</td><td>{code} AD Skopje</td></tr>" for code in codes)
+    return (
+        "<html><body><table id='otherlisting-table'><thead><tr><th>Symbol</th><th>Name</th></tr></thead>"
+        f"<tbody>{rows}</tbody></table></body></html>"
+    )
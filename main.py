@@ -1,12 +1,16 @@
+import argparse
 import asyncio
-import IssuerCodeExtractor
-import DatabaseManager
-import DataScraper
+import csv
+import json
 import time
 import sys
 import importlib.util
 import subprocess
-import MSEStockScraper
+from datetime import date
+from typing import List, Optional
+
+# Project modules are imported where they are used: pandas, bs4 and aiohttp take most of the startup
+# time, and a query or export from the command line never needs the scraping stack
 
 
 def check_dependencies():
@@ -45,10 +49,14 @@ def check_dependencies():
 
 
 def run_query_mode():
+    import DatabaseManager
+    import IssuerCodeExtractor
+
     first_pipe = IssuerCodeExtractor.IssuerCodeExtractor()
     second_pipe = DatabaseManager.DatabaseManager()
     print("Getting issuer codes...")
-    issuer_codes = first_pipe.get_issuer_codes()
+    # Validate input against the local issuer cache; only go to the network when there is no cache yet
+    issuer_codes = first_pipe.get_cached_codes(allow_stale=True) or first_pipe.get_issuer_codes()
     issuer_codes = first_pipe.filter_codes(issuer_codes)
     print(f"Found {len(issuer_codes)} valid issuer codes\n")
     print("Valid codes:")
@@ -59,10 +67,17 @@ def run_query_mode():
         if issuer_code_for_sample in issuer_codes:
             print("Enter how many rows to fetch:")
             num_rows = int(input())
-            if 0 < num_rows <= 10000:
-                print(second_pipe.fetch_sample_data(issuer_code=issuer_code_for_sample, limit=num_rows))
-            else:
-                print(second_pipe.fetch_sample_data(issuer_code=issuer_code_for_sample, limit=10000))
+            # Optional date range; repeated queries of an issuer are served from the in-memory frame cache
+            print("Enter the start date (YYYY-MM-DD, leave empty for the oldest data):")
+            start_date = input().strip() or None
+            print("Enter the end date (YYYY-MM-DD, leave empty for the newest data):")
+            end_date = input().strip() or None
+            try:
+                print(second_pipe.fetch_sample_data(issuer_code=issuer_code_for_sample,
+                                                    limit=num_rows if 0 < num_rows <= 10000 else 10000,
+                                                    start_date=start_date, end_date=end_date))
+            except ValueError as e:
+                print(f"Invalid date: {str(e)}")
         else:
             print("The code you entered is not valid")
 
@@ -75,6 +90,10 @@ def run_query_mode():
 
 
 async def main():
+    import DatabaseManager
+    import DataScraper
+    import IssuerCodeExtractor
+
     try:
 
         first_pipe = IssuerCodeExtractor.IssuerCodeExtractor()
@@ -102,7 +121,7 @@ async def main():
         start_time = time.time()
 
         print("Getting issuer codes...")
-        issuer_codes = first_pipe.get_issuer_codes()
+        issuer_codes = await first_pipe.get_issuer_codes_async()
         print(f"Found {len(issuer_codes)} valid issuer codes\n")
 
         print("Filtering issuer codes...")
@@ -110,7 +129,7 @@ async def main():
         print(f"Remaining codes: {len(issuer_codes)}\n")
 
         print("Checking data currency...")
-        update_info = second_pipe.check_data_currency(issuer_codes)
+        update_info = second_pipe.check_data_currency(issuer_codes, from_listing=first_pipe.listing_complete)
         print(f"{len(update_info)} issuers need updating\n")
 
         if update_info:
@@ -148,5 +167,248 @@ async def main():
         print(f"An error occurred: {str(e)}")
 
 
+def parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYY-MM-DD date: {value}")
+
+
+def open_scraper(args):
+    """Database manager and scraper configured from the command line."""
+    import DatabaseManager
+    import DataScraper
+
+    db_manager = DatabaseManager.DatabaseManager(args.db)
+    scraper = DataScraper.DataScraper(db_manager, base_url=args.base_url, verbose=not args.quiet,
+                                      parse_processes=args.parse_processes, metrics_dir=args.metrics_dir,
+                                      market_day_url=args.market_day_url)
+    return db_manager, scraper
+
+
+def open_extractor(args):
+    import IssuerCodeExtractor
+
+    return IssuerCodeExtractor.IssuerCodeExtractor(base_url=args.base_url)
+
+
+async def issuer_codes_for(args, extractor, session=None) -> List[str]:
+    """The issuers named with --codes, or every listed issuer (from the local cache while it is fresh)."""
+    if args.codes:
+        return args.codes
+    return extractor.filter_codes(await extractor.get_issuer_codes_async(session))
+
+
+async def run_update(args, db_manager, scraper, extractor, tail_only: bool = False):
+    """One incremental update: check which issuers are behind and fetch what they miss."""
+    start_time = time.time()
+    issuer_codes = await issuer_codes_for(args, extractor, scraper.session)
+    # Only a complete listing tells which issuers are no longer listed; --codes names a subset, and a
+    # listing page that failed without a cached copy leaves issuers out
+    update_info = db_manager.check_data_currency(issuer_codes, tail_only=tail_only,
+                                                 from_listing=not args.codes and extractor.listing_complete)
+    print(f"{len(update_info)} of {len(issuer_codes)} issuers need updating")
+    if update_info:
+        await scraper.update_data(update_info=update_info, max_concurrent_tasks=args.workers)
+    print(f"Update finished in {time.time() - start_time:.2f} seconds")
+
+
+async def command_update(args) -> int:
+    db_manager, scraper = open_scraper(args)
+    try:
+        await run_update(args, db_manager, scraper, open_extractor(args))
+    finally:
+        db_manager.close()
+    return 0
+
+
+async def command_backfill(args) -> int:
+    db_manager, scraper = open_scraper(args)
+    try:
+        start_time = time.time()
+        issuer_codes = await issuer_codes_for(args, open_extractor(args))
+        # Windows the journal lists as complete are skipped, so an interrupted backfill resumes
+        await scraper.update_data(update_info={code: args.since for code in issuer_codes},
+                                  max_concurrent_tasks=args.workers)
+        print(f"Backfill of {len(issuer_codes)} issuers finished in {time.time() - start_time:.2f} seconds")
+    finally:
+        db_manager.close()
+    return 0
+
+
+async def command_daemon(args) -> int:
+    """Run incremental updates on a schedule, keeping the session, parse pool and caches between cycles."""
+    db_manager, scraper = open_scraper(args)
+    extractor = open_extractor(args)
+    await scraper.open()
+    cycles = 0
+    try:
+        while True:
+            cycle_start = time.monotonic()
+            try:
+                # Only each issuer's newest data; issuers without history are left to the backfill command
+                await run_update(args, db_manager, scraper, extractor, tail_only=True)
+            except Exception as e:
+                # A failed cycle (e.g. the site is down) is retried at the next one
+                print(f"Update cycle failed: {str(e)}")
+            cycles += 1
+            if args.cycles and cycles >= args.cycles:
+                return 0
+            await asyncio.sleep(max(0.0, args.interval - (time.monotonic() - cycle_start)))
+    finally:
+        await scraper.close()
+        db_manager.close()
+
+
+def command_query(args) -> int:
+    import StockReader
+
+    reader = StockReader.StockReader(args.db)
+    try:
+        rows = reader.rows(args.code, args.start, args.end, columns=args.columns,
+                           ascending=not args.newest_first, limit=args.limit)
+    finally:
+        reader.close()
+    header = ['Date'] + (args.columns or list(StockReader.COLUMNS))
+
+    if args.format == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(header)
+        writer.writerows(rows)
+    elif args.format == 'json':
+        print(json.dumps([dict(zip(header, row)) for row in rows], indent=2))
+    else:
+        # Same number format as the interactive query mode
+        table = [header] + [[row[0]] + ['' if value is None else f"{value:,.2f}" for value in row[1:]]
+                            for row in rows]
+        widths = [max(len(line[i]) for line in table) for i in range(len(header))]
+        for line in table:
+            print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+    return 0
+
+
+def command_export(args) -> int:
+    import DatabaseManager
+
+    start_time = time.time()
+    db_manager = DatabaseManager.DatabaseManager(args.db)
+    try:
+        manifest = db_manager.export_snapshot(args.directory, args.codes, args.format,
+                                              None if args.no_compression else args.compression)
+    finally:
+        db_manager.close()
+    issuers = manifest['issuers'].values()
+    print(f"Exported {len(issuers)} issuers ({sum(entry['rows'] for entry in issuers)} rows, "
+          f"{sum(entry['bytes'] for entry in issuers) / (1024 * 1024):.1f} MB, {manifest['format']}) "
+          f"to {args.directory} in {time.time() - start_time:.2f} seconds")
+    return 0
+
+
+def command_import(args) -> int:
+    import DatabaseManager
+
+    start_time = time.time()
+    db_manager = DatabaseManager.DatabaseManager(args.db)
+    try:
+        imported = db_manager.import_snapshot(args.directory)
+    finally:
+        db_manager.close()
+    print(f"Imported {len(imported)} issuers ({sum(imported.values())} rows) from {args.directory} "
+          f"in {time.time() - start_time:.2f} seconds")
+    return 0
+
+
+async def command_serve(args) -> int:
+    import QueryService
+
+    service = QueryService.QueryService(args.db, connections=args.connections, cache_entries=args.cache_entries)
+    await service.serve_forever(args.host, args.port)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="MSE stock data scraper. Run without arguments for the interactive mode.")
+    parser.add_argument('--db', default='mse_stocks.db', help="SQLite database file (default: mse_stocks.db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def scrape_options(command: argparse.ArgumentParser):
+        command.add_argument('--codes', nargs='+', help="Only these issuers (default: every listed issuer)")
+        command.add_argument('--workers', type=int, default=200, help="Most requests in flight (default: 200)")
+        command.add_argument('--parse-processes', type=int, default=0,
+                             help="Parse pages in a pool of this many processes (default: 0, in threads)")
+        command.add_argument('--metrics-dir', help="Write metrics.json and metrics.prom here after each run")
+        command.add_argument('--base-url', default="https://www.mse.mk", help="Site to scrape")
+        command.add_argument('--market-day-url',
+                             help="Market-wide daily results page with a {date} placeholder (and optionally "
+                                  "{base_url}); issuers a few days behind are then caught up one page per day")
+        command.add_argument('--quiet', action='store_true', help="Print progress lines instead of every window")
+
+    update = commands.add_parser('update', help="Fetch everything missing since the last run")
+    scrape_options(update)
+    update.set_defaults(handler=command_update)
+
+    backfill = commands.add_parser('backfill', help="Fetch issuers' history, skipping windows already fetched")
+    scrape_options(backfill)
+    backfill.add_argument('--since', type=parse_date, help="First date to fetch (default: 10 years ago)")
+    backfill.set_defaults(handler=command_backfill)
+
+    daemon = commands.add_parser('daemon', help="Keep running and fetch each issuer's newest data on a schedule")
+    scrape_options(daemon)
+    daemon.add_argument('--interval', type=float, default=15 * 60,
+                        help="Seconds from the start of one update to the next (default: 900)")
+    daemon.add_argument('--cycles', type=int, default=0, help="Stop after this many updates (default: run forever)")
+    daemon.set_defaults(handler=command_daemon)
+
+    query = commands.add_parser('query', help="Print the stored rows of an issuer")
+    query.add_argument('code', help="Issuer code")
+    query.add_argument('--start', type=parse_date, help="First date (YYYY-MM-DD)")
+    query.add_argument('--end', type=parse_date, help="Last date (YYYY-MM-DD)")
+    query.add_argument('--columns', nargs='+', help="Columns after the date (default: all)")
+    query.add_argument('--limit', type=int, help="Most rows to print")
+    query.add_argument('--newest-first', action='store_true')
+    query.add_argument('--format', choices=('table', 'csv', 'json'), default='table')
+    query.set_defaults(handler=command_query)
+
+    export = commands.add_parser('export', help="Write a columnar snapshot of the stored data")
+    export.add_argument('directory')
+    export.add_argument('--codes', nargs='+', help="Only these issuers (default: all)")
+    export.add_argument('--format', choices=('feather', 'npz'),
+                        help="File format (default: feather when pyarrow is installed, else npz)")
+    export.add_argument('--compression', default='zstd', help="Feather compression (default: zstd)")
+    export.add_argument('--no-compression', action='store_true',
+                        help="Uncompressed files, which an import memory-maps without copying")
+    export.set_defaults(handler=command_export)
+
+    snapshot_import = commands.add_parser('import', help="Load a snapshot written by export")
+    snapshot_import.add_argument('directory')
+    snapshot_import.set_defaults(handler=command_import)
+
+    serve = commands.add_parser('serve', help="Serve the stored data read-only over HTTP (JSON and CSV)")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    serve.add_argument('--connections', type=int, default=4, help="Read-only database connections (default: 4)")
+    serve.add_argument('--cache-entries', type=int, default=512, help="Cached responses (default: 512)")
+    serve.set_defaults(handler=command_serve)
+    return parser
+
+
+def run_cli(argv: Optional[List[str]] = None) -> int:
+    """Non-interactive entry point; returns the process exit code."""
+    args = build_parser().parse_args(argv)
+    try:
+        result = args.handler(args)
+        if asyncio.iscoroutine(result):
+            result = asyncio.run(result)
+        return result
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return 1
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     asyncio.run(main())
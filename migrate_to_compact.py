@@ -0,0 +1,110 @@
+"""Migrate a database to the compact stock_data layout and report file size and scan speed before and after.
+
+    python migrate_to_compact.py [mse_stocks.db] [--no-backup]
+
+The rows move to the issuers/stock_rows tables; stock_data stays readable as a view, so existing
+readers keep working. A copy of the original file is kept as <db>.bak unless --no-backup is given.
+"""
+import argparse
+import os
+import shutil
+import time
+from typing import Dict
+import DatabaseManager
+
+
+def database_size(db_manager: DatabaseManager.DatabaseManager) -> int:
+    # Fold the WAL into the main file first so the size is comparable between layouts
+    db_manager.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return sum(os.path.getsize(db_manager.db_path + suffix)
+               for suffix in ('', '-wal') if os.path.exists(db_manager.db_path + suffix))
+
+
+def best_time(func, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(db_manager: DatabaseManager.DatabaseManager, repeat: int = 3) -> Dict[str, float]:
+    """File size and the scans existing readers run, all through the stock_data name."""
+    conn = db_manager.conn
+    codes = [code for code, in conn.execute("SELECT DISTINCT issuer_code FROM stock_data")]
+
+    def scan_issuers():
+        for code in codes:
+            conn.execute('SELECT "Date", "Last Trade Price", "Volume" FROM stock_data '
+                         'WHERE issuer_code = ? ORDER BY "Date"', (code,)).fetchall()
+
+    result = {
+        'size_mb': database_size(db_manager) / (1024 * 1024),
+        'rows': conn.execute("SELECT COUNT(*) FROM stock_data").fetchone()[0],
+        'full_scan_s': best_time(lambda: conn.execute('SELECT * FROM stock_data').fetchall(), repeat),
+        'issuer_scans_s': best_time(scan_issuers, repeat),
+        'last_dates_s': best_time(db_manager.get_last_dates, repeat)
+    }
+    if db_manager.compact:
+        # The same per-issuer scans without the view's date formatting, for readers that move to stock_rows
+        ids = [issuer_id for issuer_id, in conn.execute("SELECT issuer_id FROM issuers")]
+
+        def scan_issuers_native():
+            for issuer_id in ids:
+                conn.execute("SELECT day, last_trade_price, volume FROM stock_rows WHERE issuer_id = ? "
+                             "ORDER BY day", (issuer_id,)).fetchall()
+
+        result['issuer_scans_native_s'] = best_time(scan_issuers_native, repeat)
+    return result
+
+
+def print_report(before: Dict[str, float], after: Dict[str, float]):
+    print(f"\n{'':<16}{'before':>12}{'after':>12}{'ratio':>8}")
+    for name in ('size_mb', 'rows', 'full_scan_s', 'issuer_scans_s', 'last_dates_s'):
+        ratio = after[name] / before[name] if before[name] else 0.0
+        print(f"{name:<16}{before[name]:>12.3f}{after[name]:>12.3f}{ratio:>8.2f}")
+    if 'issuer_scans_native_s' in after:
+        native = after['issuer_scans_native_s']
+        ratio = native / before['issuer_scans_s'] if before['issuer_scans_s'] else 0.0
+        print(f"{'issuer_scans_s':<16}{'':>12}{native:>12.3f}{ratio:>8.2f}  (stock_rows directly)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate stock_data to the compact schema")
+    parser.add_argument('db_path', nargs='?', default='mse_stocks.db')
+    parser.add_argument('--no-backup', action='store_true', help="Do not keep a copy of the original file")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per timed scan (the best one counts)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        print(f"Database not found: {args.db_path}")
+        return
+
+    db_manager = DatabaseManager.DatabaseManager(args.db_path)
+    if db_manager.compact:
+        print(f"{args.db_path} already uses the compact schema")
+        db_manager.close()
+        return
+    before = measure(db_manager, args.repeat)
+    db_manager.close()
+
+    if not args.no_backup:
+        shutil.copy2(args.db_path, args.db_path + '.bak')
+        print(f"Original kept as {args.db_path}.bak")
+
+    start = time.perf_counter()
+    db_manager = DatabaseManager.DatabaseManager(args.db_path, compact=True)
+    print(f"Migrated {args.db_path} in {time.perf_counter() - start:.2f}s")
+    after = measure(db_manager, args.repeat)
+    db_manager.close()
+
+    if after['rows'] != before['rows']:
+        print(f"Warning: {before['rows']} rows before the migration, {after['rows']} after "
+              f"(rows without a valid date are dropped)")
+    print_report(before, after)
+
+
+if __name__ == "__main__":
+    main()
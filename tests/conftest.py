@@ -0,0 +1,36 @@
+import asyncio
+import os
+import socket
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import pytest
+import stand_in_server
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def run_stand_in():
+    """Run scenario(server, base_url) against an in-process stand-in of the MSE pages; returns its result.
+
+    Keyword arguments configure the StandInServer (issuers, error_rate, ...).
+    """
+    def run(scenario, **server_kwargs):
+        async def main():
+            server = stand_in_server.StandInServer(**server_kwargs)
+            port = free_port()
+            await server.start('127.0.0.1', port)
+            try:
+                return await scenario(server, f"http://127.0.0.1:{port}")
+            finally:
+                await server.stop()
+        return asyncio.run(main())
+    return run
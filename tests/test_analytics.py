@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import DatabaseManager
+import DatabaseWriter
+import StockRows
+
+
+def trading_rows(days):
+    """Rows with close 100 + n on the n-th day, high/low one above/below, volume n and turnover 10 n."""
+    n = np.arange(len(days), dtype=np.float64)
+    close = 100 + n
+    values = np.array([close, close + 1, close - 1, n, 10 * n])
+    return StockRows.StockRows.from_arrays(np.array(days, dtype='datetime64[D]'), values)
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_incremental_write_updates_moving_averages_and_weekly_ohlc(tmp_path, compact):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'), compact=compact)
+    days = pd.bdate_range('2024-01-01', periods=40).to_numpy(dtype='datetime64[D]')
+    rows = trading_rows(days)
+    db_manager.save_data(rows.select(np.arange(40) < 32), 'AAAA')
+
+    # The rest arrives through the writer, which only marks the tail and recomputes it when it stops
+    writer = DatabaseWriter.DatabaseWriter(db_manager)
+    writer.start()
+    writer.submit(rows.select(np.arange(40) >= 32), 'AAAA')
+    writer.stop()
+    assert writer.errors == []
+    assert db_manager.conn.execute("SELECT COUNT(*) FROM analytics_pending").fetchone()[0] == 0
+
+    close = pd.Series(100 + np.arange(40, dtype=np.float64))
+    daily = db_manager.query_analytics('AAAA', 'daily')
+    assert len(daily) == 40
+    np.testing.assert_allclose(daily['ma20'].to_numpy(), close.rolling(20).mean().to_numpy(), equal_nan=True)
+    assert daily['ma20'].iloc[-1] == pytest.approx(close.iloc[20:].mean())
+
+    # The week of Mon 12 Feb (days 30-34) straddles the two writes; the next one is written by the second only
+    weekly = db_manager.query_analytics('AAAA', 'weekly').set_index('period_start')
+    assert len(weekly) == 8
+    split_week = weekly.loc['2024-02-12']
+    assert (split_week['open'], split_week['high'], split_week['low'], split_week['close']) == (130, 135, 129, 134)
+    assert split_week['trading_days'] == 5
+    last_week = weekly.loc['2024-02-19']
+    assert (last_week['open'], last_week['high'], last_week['low'], last_week['close']) == (135, 140, 134, 139)
+    assert (last_week['volume'], last_week['turnover'], last_week['trading_days']) == (185, 1850, 5)
+
+    # Incremental results match a recomputation from scratch
+    db_manager.rebuild_analytics(['AAAA'])
+    pd.testing.assert_frame_equal(db_manager.query_analytics('AAAA', 'daily'), daily)
+    pd.testing.assert_frame_equal(db_manager.query_analytics('AAAA', 'weekly').set_index('period_start'), weekly)
+    db_manager.close()
@@ -0,0 +1,69 @@
+import sqlite3
+import sys
+from datetime import date
+
+import DatabaseManager
+import migrate_to_compact
+
+# stock_data as the original row-store layout created it
+BASELINE_SCHEMA = '''
+    CREATE TABLE stock_data (
+        issuer_code TEXT,
+        "Date" DATE,
+        "Last Trade Price" REAL,
+        "Max" REAL,
+        "Min" REAL,
+        "Volume" REAL,
+        "Turnover in BEST (denars)" REAL,
+        PRIMARY KEY (issuer_code, "Date")
+    )
+'''
+
+BASELINE_ROWS = [
+    ('AAAA', '2023-12-29', 1640.5, 1650.0, 1630.0, 93.0, 152566.5),
+    ('AAAA', '2024-01-02', 1630.0, 1640.0, None, 90.0, 146700.0),
+    ('AAAB', '2024-01-02', 21600.0, 21600.0, 21500.0, 4.0, 86300.0),
+]
+
+SELECT_ALL = 'SELECT * FROM stock_data ORDER BY issuer_code, "Date"'
+
+
+def test_migration_keeps_every_row_and_value(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'stocks.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(BASELINE_SCHEMA)
+        conn.executemany("INSERT INTO stock_data VALUES (?, ?, ?, ?, ?, ?, ?)", BASELINE_ROWS)
+    conn.close()
+
+    monkeypatch.setattr(sys, 'argv', ['migrate_to_compact.py', db_path, '--repeat', '1'])
+    migrate_to_compact.main()
+
+    db_manager = DatabaseManager.DatabaseManager(db_path)
+    assert db_manager.compact
+    assert db_manager.conn.execute(SELECT_ALL).fetchall() == BASELINE_ROWS
+    schema = dict(db_manager.conn.execute("SELECT name, sql FROM sqlite_master WHERE name IN "
+                                          "('stock_data', 'stock_rows')").fetchall())
+    assert schema['stock_data'].startswith('CREATE VIEW')
+    assert 'WITHOUT ROWID' in schema['stock_rows']
+    assert db_manager.get_last_dates() == {'AAAA': date(2024, 1, 2), 'AAAB': date(2024, 1, 2)}
+    db_manager.close()
+
+    with sqlite3.connect(db_path + '.bak') as backup:
+        assert backup.execute(SELECT_ALL).fetchall() == BASELINE_ROWS
+    backup.close()
+
+
+def test_inserts_into_the_view_upsert_into_the_compact_tables(tmp_path):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'), compact=True)
+    with db_manager.conn as conn:
+        conn.executemany("INSERT INTO stock_data VALUES (?, ?, ?, ?, ?, ?, ?)", BASELINE_ROWS)
+        # The same (issuer, day) again replaces the values instead of failing
+        conn.execute("INSERT INTO stock_data VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     ('AAAA', '2024-01-02', 1635.0, 1645.0, 1620.0, 95.0, 155000.0))
+
+    expected = BASELINE_ROWS[:1] + [('AAAA', '2024-01-02', 1635.0, 1645.0, 1620.0, 95.0, 155000.0)] + BASELINE_ROWS[2:]
+    assert db_manager.conn.execute(SELECT_ALL).fetchall() == expected
+    assert db_manager.conn.execute("SELECT COUNT(*) FROM stock_rows").fetchone()[0] == 3
+    assert [code for code, in db_manager.conn.execute("SELECT issuer_code FROM issuers ORDER BY issuer_id")] == \
+        ['AAAA', 'AAAB']
+    db_manager.close()
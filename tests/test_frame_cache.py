@@ -0,0 +1,25 @@
+import numpy as np
+
+import DatabaseManager
+import StockRows
+
+
+def rows(*days):
+    values = np.arange(len(StockRows.VALUE_COLUMNS) * len(days), dtype=np.float64)
+    return StockRows.StockRows.from_arrays(np.array(days, dtype='datetime64[D]'), values)
+
+
+def test_cached_frame_is_dropped_after_a_write_from_another_connection(tmp_path):
+    path = str(tmp_path / 'stocks.db')
+    reader = DatabaseManager.DatabaseManager(path)
+    writer = DatabaseManager.DatabaseManager(path)
+    writer.save_data(rows('2024-03-04'), 'AAAA')
+
+    assert len(reader.issuer_frame('AAAA')) == 1
+    assert len(reader.issuer_frame('AAAA')) == 1 and reader.frame_cache.hits == 1
+
+    writer.save_data(rows('2024-03-05'), 'AAAA')
+    assert len(reader.issuer_frame('AAAA')) == 2
+    assert len(reader.query('AAAA')) == 2
+    writer.close()
+    reader.close()
@@ -0,0 +1,14 @@
+import IssuerCodeExtractor
+
+
+def test_refresh_fetches_only_the_listing_pages(tmp_path, run_stand_in):
+    async def scenario(server, base_url):
+        extractor = IssuerCodeExtractor.IssuerCodeExtractor(cache_path=str(tmp_path / 'issuer_codes.json'),
+                                                            base_url=base_url)
+        codes = await extractor.get_issuer_codes_async()
+        cached = await extractor.get_issuer_codes_async()  # Within the TTL: no request
+        return codes, cached, server.codes, dict(server.requests)
+
+    codes, cached, listed, requests = run_stand_in(scenario, issuers=6)
+    assert codes == cached == listed
+    assert requests == {'listing': 2}
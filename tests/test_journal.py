@@ -0,0 +1,118 @@
+from datetime import date, datetime, timedelta
+
+import DataScraper
+import DatabaseManager
+import ResultsTableParser
+import StockRows
+
+
+def scrape(run_stand_in, db_manager, update_info, **server_kwargs):
+    async def scenario(server, base_url):
+        scraper = DataScraper.DataScraper(db_manager, base_url=base_url, use_window_cache=False, verbose=False)
+        await scraper.update_data(update_info)
+        return scraper
+    return run_stand_in(scenario, **server_kwargs)
+
+
+def test_parse_error_fails_the_window_instead_of_journaling_it(tmp_path, run_stand_in, monkeypatch):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'))
+    to_rows = ResultsTableParser.to_rows
+    failures = []
+
+    def failing_once(columns):
+        if not failures:
+            failures.append(columns['Date'][-1])
+            raise ValueError("unparsable page")
+        return to_rows(columns)
+
+    monkeypatch.setattr(ResultsTableParser, 'to_rows', failing_once)
+    scraper = scrape(run_stand_in, db_manager, {'AAAA': None}, issuers=1)
+
+    assert len(scraper.errors) == 1 and "unparsable page" in scraper.errors[0]
+    failed_year = datetime.strptime(failures[0], "%m/%d/%Y").year
+    assert date(failed_year, 1, 1) not in db_manager.get_journal()['AAAA']
+    # The next run plans the failed window again instead of only today
+    update_info = db_manager.check_data_currency(['AAAA'])
+    assert update_info['AAAA'] <= max(date(failed_year, 1, 1), date.today() - timedelta(days=DatabaseManager.HISTORY_DAYS))
+
+    monkeypatch.setattr(ResultsTableParser, 'to_rows', to_rows)
+    scraper = scrape(run_stand_in, db_manager, update_info, issuers=1)
+    assert scraper.errors == []
+    assert date(failed_year, 1, 1) in db_manager.get_journal()['AAAA']
+    assert db_manager.check_data_currency(['AAAA']) == {'AAAA': date.today()}
+    db_manager.close()
+
+
+def test_window_without_table_is_fetched_again_before_it_is_trusted(tmp_path):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'))
+    window = (date(2020, 1, 1), date(2020, 12, 31))
+
+    db_manager.save_data(None, 'AAAA', window)
+    assert db_manager.find_missing_windows(*window, db_manager.get_journal()['AAAA']) == [window]
+    assert db_manager.check_data_currency(['AAAA'], tail_only=True) == {}
+
+    db_manager.save_data(None, 'AAAA', window)
+    assert db_manager.get_journal()['AAAA'][window[0]][2] == 'no_table_confirmed'
+    assert db_manager.find_missing_windows(*window, db_manager.get_journal()['AAAA']) == []
+
+    # A table without rows is trusted right away
+    db_manager.save_data(StockRows.StockRows.empty_rows(), 'BBBB', window)
+    assert db_manager.find_missing_windows(*window, db_manager.get_journal()['BBBB']) == []
+    db_manager.close()
+
+
+def test_only_a_full_listing_marks_issuers_as_unlisted(tmp_path):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'))
+    db_manager.check_data_currency(['AAAA', 'BBBB'], from_listing=True)
+    db_manager.check_data_currency(['AAAA'])  # e.g. update --codes AAAA
+    assert db_manager.get_activity()['BBBB'][2] is True
+
+    db_manager.check_data_currency(['AAAA'], from_listing=True)
+    assert db_manager.get_activity()['BBBB'][2] is False
+    db_manager.close()
+
+
+def test_unlisted_issuer_rests_although_it_traded_recently(tmp_path):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'))
+    now = datetime.now()
+    yesterday = now.date() - timedelta(days=1)
+    journal = {date(yesterday.year, 1, 1): (date(yesterday.year, 1, 1), yesterday, 'data')}
+    missing = [(now.date(), now.date())]
+    checked = now - timedelta(days=1)
+
+    assert not db_manager.is_resting(journal, (yesterday, checked, True), missing, now)
+    assert db_manager.is_resting(journal, (yesterday, checked, False), missing, now)
+    # Still checked every few weeks, in case it is listed again
+    stale = now - timedelta(days=DatabaseManager.MAX_RECHECK_DAYS + 1)
+    assert not db_manager.is_resting(journal, (yesterday, stale, False), missing, now)
+    db_manager.close()
+
+
+def test_window_with_an_unparsable_date_is_partial_until_fetched_whole(tmp_path, run_stand_in, monkeypatch):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'))
+    parse_results_table = ResultsTableParser.parse_results_table
+    window = (date(2020, 1, 1), date(2020, 12, 31))
+
+    def one_bad_date(html, *args, **kwargs):
+        columns = parse_results_table(html, *args, **kwargs)
+        if columns['Date'][0].endswith('/2020'):
+            columns['Date'][0] = 'n/a'
+        return columns
+
+    monkeypatch.setattr(ResultsTableParser, 'parse_results_table', one_bad_date)
+    scraper = scrape(run_stand_in, db_manager, {'AAAA': window[0]}, issuers=1)
+    stored = len(db_manager.query('AAAA', *window, use_cache=False))
+
+    assert scraper.errors == []
+    assert scraper.metrics.counters['rows_dropped'] == 1
+    journal = db_manager.get_journal()['AAAA']
+    assert journal[window[0]][2] == 'partial'
+    assert db_manager.find_missing_windows(*window, journal) == [window]
+
+    monkeypatch.setattr(ResultsTableParser, 'parse_results_table', parse_results_table)
+    scrape(run_stand_in, db_manager, {'AAAA': window[0]}, issuers=1)
+    journal = db_manager.get_journal()['AAAA']
+    assert journal[window[0]][2] == 'data'
+    assert db_manager.find_missing_windows(*window, journal) == []
+    assert len(db_manager.query('AAAA', *window, use_cache=False)) == stored + 1
+    db_manager.close()
@@ -0,0 +1,36 @@
+import argparse
+
+import DataScraper
+import DatabaseManager
+import IssuerCodeExtractor
+import main
+
+
+def update_listing_run(tmp_path, run_stand_in, db_manager, break_listing: bool):
+    """One run_update (tail only, so nothing is scraped) against the stand-in; returns the extractor."""
+    async def scenario(server, base_url):
+        extractor = IssuerCodeExtractor.IssuerCodeExtractor(cache_path=str(tmp_path / f'codes_{break_listing}.json'),
+                                                            base_url=base_url)
+        if break_listing:
+            extractor.urls[1] = f"{base_url}/en/issuers/missing/page"  # Fails with 404, no cached copy
+        scraper = DataScraper.DataScraper(db_manager, base_url=base_url, use_window_cache=False, verbose=False)
+        await main.run_update(argparse.Namespace(codes=None, workers=4), db_manager, scraper, extractor,
+                              tail_only=True)
+        return extractor
+    return run_stand_in(scenario, issuers=4)
+
+
+def test_partial_listing_does_not_unlist_issuers(tmp_path, run_stand_in):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'))
+    db_manager.update_listing(['AAAA', 'AAAB', 'AAAC', 'AAAD', 'ZZZZ'])
+
+    extractor = update_listing_run(tmp_path, run_stand_in, db_manager, break_listing=True)
+    assert not extractor.listing_complete
+    assert all(listed for _, _, listed in db_manager.get_activity().values())
+
+    extractor = update_listing_run(tmp_path, run_stand_in, db_manager, break_listing=False)
+    assert extractor.listing_complete
+    activity = db_manager.get_activity()
+    assert activity['ZZZZ'][2] is False
+    assert all(activity[code][2] for code in ['AAAA', 'AAAB', 'AAAC', 'AAAD'])
+    db_manager.close()
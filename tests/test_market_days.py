@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+
+import DataScraper
+import DatabaseManager
+import MarketDayScraper
+import ResultsTableParser
+import StockRows
+from synthetic_pages import issuer_codes, market_day_page
+
+MARKET_DAY_URL = "{base_url}/en/stats/daily-results?date={date}"
+
+
+def journal_through(db_manager, issuer_code: str, day: date):
+    """Journal an issuer as fetched through day, so it counts as having history."""
+    db_manager.save_data(StockRows.StockRows.empty_rows(), issuer_code, (day, day))
+
+
+def test_planner_takes_recent_gaps_by_day_and_long_gaps_per_issuer(tmp_path):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'))
+    today = datetime.now().date()
+    recent = [f"R{index:03d}" for index in range(5)]
+    update_info = {code: today - timedelta(days=1) for code in recent}
+    update_info['OLD'] = today - timedelta(days=200)
+    update_info['NEW'] = None  # No history: always a per-issuer backfill
+    for code in recent + ['OLD']:
+        journal_through(db_manager, code, update_info[code] - timedelta(days=1))
+
+    scraper = DataScraper.DataScraper(db_manager, use_window_cache=False, verbose=False,
+                                      market_day_url=MARKET_DAY_URL)
+    by_day, remaining = scraper.plan_market_days(update_info)
+
+    # At most two day pages instead of five windows; OLD would add ~140 pages to save one or two windows
+    assert by_day == {code: update_info[code] for code in recent}
+    assert remaining == {'OLD': update_info['OLD'], 'NEW': None}
+    db_manager.close()
+
+
+def test_market_day_journals_both_windows_across_a_year_boundary(tmp_path):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'))
+    scraper = DataScraper.DataScraper(db_manager, use_window_cache=False, verbose=False)
+    day = date(2023, 1, 2)  # Monday after the weekend that closes 2022
+    rows = ResultsTableParser.parse_market_day(market_day_page(day, {'AAAA': 1, 'AAAB': 2}), day)
+    covered = {'AAAA': date(2022, 12, 30)}
+
+    data, entries = scraper.market_day_batch(day, rows, covered)
+
+    assert data.issuer_codes.tolist() == ['AAAA']
+    assert [(entry[1], entry[2], entry[3], entry[5], entry[6]) for entry in entries] == [
+        ('2022-01-01', '2022-12-31', '2022-12-31', 'empty', None),
+        ('2023-01-01', '2023-01-01', '2023-01-02', 'data', '2023-01-02'),
+    ]
+    assert covered == {'AAAA': day}
+    with db_manager.conn as conn:
+        db_manager.record_windows(conn, entries)
+    journal = db_manager.get_journal()['AAAA']
+    assert db_manager.find_missing_windows(date(2022, 12, 31), day, journal) == []
+    db_manager.close()
+
+
+def test_failed_market_day_sends_issuers_back_to_their_own_windows(tmp_path, run_stand_in):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'))
+    today = datetime.now().date()
+    start = today - timedelta(days=8)
+    days = MarketDayScraper.trading_days(start, today)
+    codes = issuer_codes(10)
+    for code in codes:
+        journal_through(db_manager, code, start - timedelta(days=1))
+
+    async def scenario(server, base_url):
+        scraper = DataScraper.DataScraper(db_manager, base_url=base_url, use_window_cache=False,
+                                          verbose=False, market_day_url=MARKET_DAY_URL)
+        await scraper.update_data({code: start for code in codes})
+        return scraper, dict(server.requests)
+
+    # A weekday holiday: the page has no table, which used to stop the catch-up on every run
+    scraper, requests = run_stand_in(scenario, issuers=10, holidays=[days[1]])
+
+    assert scraper.errors == []
+    assert requests['market_day'] == len(days)
+    # The first day was written from its market page; the rest comes from each issuer's windows
+    assert requests['symbolhistory'] == len(codes) * len({(days[0] + timedelta(days=1)).year, today.year})
+    journal = db_manager.get_journal()
+    assert all(db_manager.find_missing_windows(start, today, journal[code]) == [(today, today)] for code in codes)
+    assert all(db_manager.get_last_date(code) == days[-1] for code in codes)
+    db_manager.close()
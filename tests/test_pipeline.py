@@ -0,0 +1,39 @@
+import asyncio
+
+import DataScraper
+import DatabaseManager
+
+
+def test_blocked_writer_holds_back_the_fetchers(tmp_path, run_stand_in):
+    db_manager = DatabaseManager.DatabaseManager(str(tmp_path / 'stocks.db'))
+    codes = ['AAAA', 'AAAB', 'AAAC', 'AAAD', 'AAAE']
+
+    async def scenario(server, base_url):
+        scraper = DataScraper.DataScraper(db_manager, base_url=base_url, use_window_cache=False, verbose=False,
+                                          parse_workers=1, stage_queue_size=1)
+        store = scraper.store_issuer_data
+        release = asyncio.Event()
+        writes = []
+
+        async def blocked_store(issuer_code, data, window):
+            writes.append(window)
+            await release.wait()
+            return await store(issuer_code, data, window)
+
+        scraper.store_issuer_data = blocked_store
+        run = asyncio.create_task(scraper.update_data(dict.fromkeys(codes), max_concurrent_tasks=2))
+        while not writes:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.5)
+        # One window in the write stage, one per bounded queue and one per parse and fetch worker
+        fetched_while_blocked = server.requests['symbolhistory']
+        release.set()
+        await run
+        return scraper, fetched_while_blocked, server.requests['symbolhistory']
+
+    scraper, fetched_while_blocked, fetched = run_stand_in(scenario, issuers=len(codes))
+    assert scraper.errors == []
+    assert fetched_while_blocked <= 6 < fetched
+    journal = db_manager.get_journal()
+    assert sum(len(journal[code]) for code in codes) == fetched
+    db_manager.close()
@@ -0,0 +1,71 @@
+import asyncio
+
+import numpy as np
+from aiohttp.test_utils import TestClient, TestServer
+
+import DatabaseManager
+import QueryService
+import StockRows
+
+
+def rows(*days):
+    values = np.arange(len(StockRows.VALUE_COLUMNS) * len(days), dtype=np.float64)
+    return StockRows.StockRows.from_arrays(np.array(days, dtype='datetime64[D]'), values)
+
+
+def run_service(db_path, scenario):
+    """Run scenario(client) against a QueryService on db_path through aiohttp's test client."""
+    async def main():
+        service = QueryService.QueryService(db_path, connections=2)
+        async with TestClient(TestServer(service.app)) as client:
+            return await scenario(client)
+    return asyncio.run(main())
+
+
+def test_etag_revalidation_until_the_ingest_version_changes(tmp_path):
+    db_path = str(tmp_path / 'stocks.db')
+    db_manager = DatabaseManager.DatabaseManager(db_path)
+    db_manager.save_data(rows('2024-03-04'), 'AAAA')
+
+    async def scenario(client):
+        first = await client.get('/history/AAAA')
+        assert first.status == 200
+        etag = first.headers['ETag']
+        assert [row['Date'] for row in await first.json()] == ['2024-03-04']
+
+        revalidated = await client.get('/history/AAAA', headers={'If-None-Match': etag})
+        assert revalidated.status == 304
+
+        # Any write of rows, here through another connection, changes the version and the ETag
+        with db_manager.conn as conn:
+            db_manager.bump_ingest_version(conn)
+        fresh = await client.get('/history/AAAA', headers={'If-None-Match': etag})
+        assert fresh.status == 200 and fresh.headers['ETag'] != etag
+
+        db_manager.save_data(rows('2024-03-05'), 'AAAA')
+        latest = await client.get('/history/AAAA', headers={'If-None-Match': fresh.headers['ETag']})
+        assert latest.status == 200
+        assert [row['Date'] for row in await latest.json()] == ['2024-03-04', '2024-03-05']
+        return (await (await client.get('/status')).json())['cache']
+
+    cache = run_service(db_path, scenario)
+    assert cache['not_modified'] == 1
+    db_manager.close()
+
+
+def test_bad_parameters_are_rejected(tmp_path):
+    db_path = str(tmp_path / 'stocks.db')
+    db_manager = DatabaseManager.DatabaseManager(db_path)
+    db_manager.save_data(rows('2024-03-04'), 'AAAA')
+
+    async def scenario(client):
+        statuses = {}
+        for query in ('start=03/04/2024', 'order=sideways', 'limit=-1', 'format=xml', 'columns=Open'):
+            statuses[query] = (await client.get(f'/history/AAAA?{query}')).status
+        statuses['csv'] = (await client.get('/history/AAAA?format=csv&columns=Max&order=desc&limit=1')).status
+        return statuses
+
+    statuses = run_service(db_path, scenario)
+    assert statuses.pop('csv') == 200
+    assert set(statuses.values()) == {400}
+    db_manager.close()
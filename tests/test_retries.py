@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+import ConcurrencyController
+import MSEStockScraper
+from conftest import free_port
+
+
+def test_retry_after_is_clamped():
+    async def main():
+        responses = [web.Response(status=503, headers={'Retry-After': '86400'}),
+                     web.Response(text="<html></html>", content_type='text/html')]
+
+        async def symbolhistory(request):
+            return responses.pop(0)
+
+        app = web.Application()
+        app.router.add_get('/en/stats/symbolhistory/{code}', symbolhistory)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        port = free_port()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        controller = ConcurrencyController.ConcurrencyController()
+        scraper = MSEStockScraper.MSEStockScraper('AAAA', limiter=controller, base_url=f"http://127.0.0.1:{port}",
+                                                  max_retry_after=0.05, verbose=False)
+        try:
+            started = time.monotonic()
+            await scraper.fetch_html({'FromDate': '2024-01-01', 'ToDate': '2024-12-31'})
+            return time.monotonic() - started, controller.paused_until - started
+        finally:
+            await runner.cleanup()
+
+    elapsed, paused_for = asyncio.run(main())
+    assert elapsed < 5
+    assert paused_for < 1
@@ -0,0 +1,56 @@
+import json
+import os
+from datetime import date
+
+import numpy as np
+
+import DatabaseManager
+import StockRows
+
+
+def rows(*days):
+    values = np.ones((len(StockRows.VALUE_COLUMNS), len(days)))
+    return StockRows.StockRows.from_arrays(np.array(days, dtype='datetime64[D]'), values)
+
+
+def source_with_gap(path):
+    """AAAA fetched for 2020 and 2022 only; AAAB journaled without any rows."""
+    db_manager = DatabaseManager.DatabaseManager(path)
+    db_manager.save_data(rows('2020-06-01'), 'AAAA', (date(2020, 1, 1), date(2020, 12, 31)))
+    db_manager.save_data(rows('2022-03-01'), 'AAAA', (date(2022, 1, 1), date(2022, 12, 31)))
+    db_manager.save_data(StockRows.StockRows.empty_rows(), 'AAAB', (date(2021, 1, 1), date(2021, 12, 31)))
+    return db_manager
+
+
+def test_snapshot_carries_the_journal_with_its_gaps(tmp_path):
+    source = source_with_gap(str(tmp_path / 'source.db'))
+    source.export_snapshot(str(tmp_path / 'snapshot'))
+    target = DatabaseManager.DatabaseManager(str(tmp_path / 'target.db'))
+    target.import_snapshot(str(tmp_path / 'snapshot'))
+
+    assert target.get_journal() == source.get_journal()
+    journal = target.get_journal()['AAAA']
+    assert target.find_missing_windows(date(2020, 1, 1), date(2022, 12, 31), journal) == [
+        (date(2021, 1, 1), date(2021, 12, 31))]
+    source.close()
+    target.close()
+
+
+def test_snapshot_without_journal_is_covered_from_its_first_date(tmp_path):
+    source = source_with_gap(str(tmp_path / 'source.db'))
+    source.export_snapshot(str(tmp_path / 'snapshot'))
+    manifest_path = os.path.join(str(tmp_path / 'snapshot'), 'manifest.json')
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    del manifest['journal']  # As written before the journal was exported
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+    target = DatabaseManager.DatabaseManager(str(tmp_path / 'target.db'))
+    target.import_snapshot(str(tmp_path / 'snapshot'))
+    journal = target.get_journal()['AAAA']
+    assert min(journal) == date(2020, 1, 1)
+    assert target.find_missing_windows(date(2019, 1, 1), date(2022, 3, 1), journal) == [
+        (date(2019, 1, 1), date(2019, 12, 31)), (date(2020, 1, 1), date(2020, 12, 31))]
+    source.close()
+    target.close()
@@ -0,0 +1,48 @@
+import os
+from datetime import date
+
+import MarketDayScraper
+import MSEStockScraper
+import WindowCache
+
+MARKET_DAY_URL = "{base_url}/en/stats/daily-results?date={date}"
+
+
+def test_only_pages_with_the_results_table_are_cached(tmp_path, run_stand_in):
+    cache = WindowCache.WindowCache(str(tmp_path / 'window_cache'))
+    trading_day, holiday = date(2024, 3, 4), date(2024, 3, 5)
+
+    async def scenario(server, base_url):
+        scraper = MarketDayScraper.MarketDayScraper(MARKET_DAY_URL, base_url=base_url, cache=cache, verbose=False)
+        await scraper.scrape_day(trading_day)
+        for _ in range(2):
+            try:
+                await scraper.scrape_day(holiday)
+            except MSEStockScraper.FetchError:
+                pass
+        await scraper.scrape_day(trading_day)
+        return dict(server.requests)
+
+    requests = run_stand_in(scenario, issuers=3, holidays=[holiday])
+
+    # The trading day comes from the cache the second time; the page without a table is asked for again
+    assert requests['market_day'] == 3
+    assert cache.get(MarketDayScraper.MARKET_CODE, holiday.isoformat(), holiday.isoformat()) is None
+    assert cache.stats()['stores'] == 1
+
+
+def test_open_tail_windows_share_one_entry_per_issuer_and_year(tmp_path):
+    cache = WindowCache.WindowCache(str(tmp_path / 'window_cache'))
+    today = date.today()
+    year_start = date(today.year, 1, 1).isoformat()
+
+    # Daily tail windows start one day later each time but all end today
+    cache.put('AAAA', year_start, today.isoformat(), "<html>first</html>", etag='"1"')
+    cache.put('AAAA', today.isoformat(), today.isoformat(), "<html>second</html>", etag='"2"')
+    cache.put('AAAA', '2020-01-01', '2020-12-31', "<html>closed</html>")
+
+    pages = [name for _, _, files in os.walk(cache.cache_dir) for name in files if name.endswith('.html.gz')]
+    assert len(pages) == 2
+    entry = cache.get('AAAA', year_start, today.isoformat())
+    assert entry['html'] == "<html>second</html>" and entry['etag'] == '"2"' and not entry['closed']
+    assert cache.get('AAAA', '2020-01-01', '2020-12-31')['closed']